@@ -0,0 +1,196 @@
+import os
+import sys
+import json
+import copy
+import time
+import types
+import argparse
+import tempfile
+import threading
+import tracemalloc
+import contextlib
+from datetime import datetime, timedelta
+from pathlib import Path
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+import tweepy
+
+#run the bot's pipeline offline against recorded fixtures, with every sleep virtual
+#python Benchmarks/RunBenchmarks.py [--scenario NAME] [--json results.json]
+
+FIXTURES_PATH = os.path.join(Path(os.path.realpath(__file__)).parent, "Fixtures")
+sys.path.insert(0, str(Path(os.path.realpath(__file__)).parent.parent))
+import CongressionalVotesTwitterBot as bot
+
+#name, days, votes per day
+SCENARIOS = [
+    ('single', 1, 1),
+    ('vote-a-rama', 1, 200),
+    ('backfill-90-days', 90, 8),
+]
+SCENARIO_START = datetime(2023, 3, 1)
+
+def loadFixture(name):
+    with open(os.path.join(FIXTURES_PATH, name), 'rb') as f:
+        return f.read()
+
+def buildVotes(days, votesPerDay):
+    #clone the recorded votes across the scenario's days, cycling through the vote types
+    templates = json.loads(loadFixture('votes.json'))['results']['votes']
+    votes = []
+    rollCalls = {}
+    for day in range(days):
+        date = SCENARIO_START + timedelta(days=day)
+        for index in range(votesPerDay):
+            vote = copy.deepcopy(templates[len(votes) % len(templates)])
+            rollCalls[vote['chamber']] = rollCalls.get(vote['chamber'], 0) + 1
+            vote['roll_call'] = rollCalls[vote['chamber']]
+            vote['date'] = date.strftime("%Y-%m-%d")
+            vote['time'] = (datetime(2000, 1, 1, 9) + timedelta(minutes=index * 4)).strftime("%H:%M:%S")
+            votes.append(vote)
+    return votes
+
+class FixtureAdapter(BaseAdapter):
+    #transport that answers propublica and c-span requests from the fixtures instead of the network
+    def __init__(self, votes):
+        super().__init__()
+        self.votes = votes
+        self.calls = {}
+        self.member = loadFixture('member.json')
+        self.bill = loadFixture('bill.json')
+        self.cspan = loadFixture('cspan_search.html')
+
+    def send(self, request, **kwargs):
+        url = request.url
+        host = url.split('/')[2]
+        self.calls[host] = self.calls.get(host, 0) + 1
+
+        status = 200
+        if host == 'www.c-span.org':
+            content = self.cspan
+        elif '/members/' in url:
+            content = self.member
+        elif '/bills/' in url:
+            content = self.bill
+        elif '/votes/' in url:
+            start, end = url.split('/')[-2:]
+            end = end.replace('.json', '')
+            votes = [v for v in self.votes if start <= v['date'] <= end]
+            votes.reverse()
+            content = json.dumps({'status': 'OK', 'results': {'chamber': 'Both', 'offset': 0, 'num_results': len(votes), 'votes': votes}}).encode()
+        else:
+            status = 404
+            content = b'{"status": "ERROR"}'
+
+        response = requests.Response()
+        response.status_code = status
+        response._content = content
+        response._content_consumed = True
+        response.headers = CaseInsensitiveDict({'Content-Type': 'application/json'})
+        response.encoding = 'utf-8'
+        response.url = url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+class FakeTwitterClient:
+    #stands in for tweepy.Client, hands out increasing tweet ids
+    tweets = 0
+
+    def __init__(self, **kwargs):
+        #the bot swaps this for its pooled twitter session, like it does on a real client
+        self.session = requests.Session()
+
+    def create_tweet(self, in_reply_to_tweet_id=None, text=''):
+        FakeTwitterClient.tweets += 1
+        response = requests.Response()
+        response.status_code = 201
+        response._content = json.dumps({'data': {'id': str(1000000 + FakeTwitterClient.tweets), 'text': text}}).encode()
+        response._content_consumed = True
+        response.headers = CaseInsensitiveDict({'x-rate-limit-remaining': '100000', 'x-rate-limit-reset': str(int(bot.CLOCK.time()) + 900)})
+        return response
+
+def resetBot(basePath, adapter):
+    #point the bot at a fresh data folder and the fixture transport
+    bot.BASE_PATH = basePath
+    bot.DATABASE_LOCAL = threading.local()
+    bot.CACHE = None
+    bot.CACHE_STATS.clear()
+    bot.CACHE_DIRTY = False
+    bot.RATE_BUCKETS.clear()
+    bot.MEMBER_INDEX = {}
+    bot.POLL_VALIDATORS.clear()
+    bot.HTTP_SESSIONS.clear()
+    bot.HTTP_STATS.clear()
+    for host in ('api.propublica.org', 'www.c-span.org'):
+        session = bot.PooledSession(host)
+        session.mount('https://', adapter)
+        bot.HTTP_SESSIONS[host] = session
+        bot.HTTP_STATS[host] = {'requests': 0, 'errors': 0, 'retries': 0, 'seconds': 0.0}
+
+    bot.CLOCK = bot.VirtualClock(SCENARIO_START)
+    bot.tweepy = types.SimpleNamespace(Client=FakeTwitterClient, errors=tweepy.errors)
+    bot.TWITTER_CLIENT = None
+    FakeTwitterClient.tweets = 0
+
+    #everything before the scenario counts as already posted
+    os.makedirs(os.path.join(basePath, "Data"))
+    with open(os.path.join(basePath, "Data", "LastPostTimestamp.dat"), 'w') as f:
+        f.write(str(SCENARIO_START - timedelta(seconds=1)))
+
+def runScenario(name, days, votesPerDay, basePath):
+    votes = buildVotes(days, votesPerDay)
+    adapter = FixtureAdapter(votes)
+    resetBot(basePath, adapter)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        voteData = bot.getVotesInDateRange(SCENARIO_START, SCENARIO_START + timedelta(days=days - 1))
+        newVotes = bot.getNewPostData(voteData)
+        bot.postNewVotes(newVotes)
+        bot.publishOutbox()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        'scenario': name,
+        'votes': len(newVotes),
+        'seconds': round(elapsed, 3),
+        'votesPerSecond': round(len(newVotes) / elapsed, 1),
+        'propublicaCallsPerVote': round(adapter.calls.get('api.propublica.org', 0) / len(newVotes), 2),
+        'cspanCallsPerVote': round(adapter.calls.get('www.c-span.org', 0) / len(newVotes), 2),
+        'tweetsPerVote': round(FakeTwitterClient.tweets / len(newVotes), 2),
+        'virtualSleepSeconds': round(bot.CLOCK.slept, 1),
+        'peakMemoryMB': round(peak / 1024 / 1024, 2),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline throughput benchmarks for the bot pipeline')
+    parser.add_argument('--scenario', choices=[s[0] for s in SCENARIOS], help='run only this scenario')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tempPath:
+        for name, days, votesPerDay in SCENARIOS:
+            if args.scenario != None and args.scenario != name:
+                continue
+            results.append(runScenario(name, days, votesPerDay, os.path.join(tempPath, name)))
+        bot.flushLog()
+
+    columns = list(results[0].keys())
+    print('  '.join(f'{c:>22}' for c in columns))
+    for result in results:
+        print('  '.join(f'{str(result[c]):>22}' for c in columns))
+
+    if args.json != None:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=4)
+
+if __name__ == '__main__':
+    main()
@@ -3,11 +3,35 @@ from datetime import datetime, timedelta
 from pathlib import Path
 from enum import Enum
 import requests
-import tweepy
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlparse
 import time
+import math
 import re
+import random
+import threading
+import json
+import sqlite3
+import hashlib
+import shutil
+import tempfile
+import codecs
+import argparse
+import signal
+import queue
+import atexit
+import itertools
+import string
+import unicodedata
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 import dotenv
-import humanize
+
+#imported the first time they're needed so a restart is back to polling quickly
+tweepy = None
+humanize = None
 
 #enum for chamber
 class Chamber(Enum):
@@ -21,6 +45,137 @@ class Endpoints(Enum):
     MEMBERS = 'members'
     AMENDMENTS = 'amendments'
 
+#raised when another shard has taken over the outbox thread we were posting
+class LeaseLostError(Exception):
+    pass
+
+#raised out of a wait that a shutdown cut short
+class ShutdownError(Exception):
+    pass
+
+#raised when twitter refuses the account or app rather than the tweet, nothing will post until that's sorted out
+class TwitterAccountError(Exception):
+    pass
+
+#one vote, only the parts of the api's vote the bot reads
+#built once per vote as it's decoded, with the time parsed here rather than every time it's compared
+class Vote:
+    FIELDS = ('chamber', 'congress', 'session', 'roll_call', 'date', 'time', 'question', 'description', 'result', 'url', 'bill', 'amendment', 'nomination', 'total', 'democratic', 'republican', 'independent')
+    NESTED_FIELDS = {
+        'bill': ('bill_id', 'number', 'title', 'api_uri', 'sponsor_id'),
+        'amendment': ('number', 'sponsor', 'sponsor_id', 'sponsor_party', 'sponsor_state'),
+        'nomination': ('number',),
+        'democratic': ('yes', 'no', 'present', 'not_voting'),
+        'republican': ('yes', 'no', 'present', 'not_voting'),
+        'independent': ('yes', 'no', 'present', 'not_voting'),
+    }
+    __slots__ = FIELDS + ('key', 'timestamp', 'when')
+
+    def __init__(self, data):
+        #data is a vote as the api returns it, or as toJson saved it
+        for field in Vote.FIELDS:
+            value = data.get(field)
+            if field in Vote.NESTED_FIELDS:
+                value = {k: value[k] for k in Vote.NESTED_FIELDS[field] if k in value} if value != None else {}
+            setattr(self, field, value)
+        self.key = (self.chamber, int(self.congress), int(self.session), int(self.roll_call))
+        self.timestamp = self.date + " " + self.time
+        self.when = datetime.strptime(self.timestamp, "%Y-%m-%d %H:%M:%S")
+
+    def toJson(self):
+        return {field: getattr(self, field) for field in Vote.FIELDS}
+
+#the clock the bot reads and sleeps on
+class SystemClock:
+    def time(self):
+        return time.time()
+
+    def monotonic(self):
+        return time.monotonic()
+
+    def now(self):
+        return datetime.now()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    def wait(self, event, seconds):
+        #wait for an event or until the time is up, returns whether the event is set
+        return event.wait(seconds)
+
+#a clock that only moves when something sleeps on it or it's moved forward, for replays and benchmarks
+#waits cost nothing, and the same input always sees the same times
+class VirtualClock(SystemClock):
+    def __init__(self, start: datetime):
+        self.current = start.timestamp()
+        self.slept = 0.0
+        self.lock = threading.Lock()
+
+    def time(self):
+        return self.current
+
+    def monotonic(self):
+        return self.current
+
+    def now(self):
+        return datetime.fromtimestamp(self.current)
+
+    def sleep(self, seconds):
+        with self.lock:
+            self.current += max(0, seconds)
+            self.slept += max(0, seconds)
+
+    def wait(self, event, seconds):
+        if not event.is_set():
+            self.sleep(seconds)
+        return event.is_set()
+
+    def advanceTo(self, when: datetime):
+        with self.lock:
+            self.current = max(self.current, when.timestamp())
+
+#stands in for twitter when POST_TWEETS is off, handing out ids in order
+#with record set it also keeps every tweet, which only a replay wants since a test run posts forever
+class RecordingPublisher:
+    def __init__(self, record=False):
+        self.record = record
+        self.tweets = []
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def post(self, tweet, replyToID=None, stopEmbeds=False):
+        with self.lock:
+            tweetID = f'test-{next(self.ids)}'
+            if self.record:
+                self.tweets.append({'id': tweetID, 'replyTo': replyToID, 'stopEmbeds': stopEmbeds, 'text': tweet})
+        return tweetID
+
+#the keep-alive session for one host, every request over it gets HTTP_TIMEOUT unless it sets its own and is counted in HTTP_STATS
+#tweepy posts over one of these too, and it never passes a timeout
+class PooledSession(requests.Session):
+    def __init__(self, host):
+        super().__init__()
+        self.host = host
+
+    def request(self, method, url, **kwargs):
+        if kwargs.get('timeout') == None:
+            kwargs['timeout'] = HTTP_TIMEOUT
+
+        start = time.perf_counter()
+        failed = True
+        try:
+            r = super().request(method, url, **kwargs)
+            failed = False
+            return r
+        finally:
+            countMetric('http_requests_total')
+            with HTTP_LOCK:
+                stats = HTTP_STATS[self.host]
+                stats['requests'] += 1
+                stats['seconds'] += time.perf_counter() - start
+                if failed:
+                    stats['errors'] += 1
+
 #globals
 BASE_PATH = ''
 BOT_SCREEN_NAME = 'congressvotesbt'
@@ -34,97 +189,1004 @@ PROPUBLICA_API_KEY = ''
 
 #for testing
 POST_TWEETS = True
+CLOCK = SystemClock()
 UPDATE_BIO = False
 
-def saveLastPostTimestamp(timestamp: datetime):
-    #save the last post timestamp so we know which records (should) have already been posted
-    log(f'Saving last post timestamp [{str(timestamp)}]')
+#http client settings, one pooled keep-alive session per host
+HTTP_TIMEOUT = (5, 30)
+HTTP_MAX_CONNECTIONS_PER_HOST = 4
+HTTP_MAX_RETRIES = 4
+HTTP_BACKOFF_BASE = 2
+HTTP_BACKOFF_MAX = 60
+HTTP_RETRY_STATUSES = (429, 500, 502, 503, 504)
+HTTP_STREAM_CHUNK_SIZE = 65536
+HTTP_OFFLINE = False
+HTTP_SESSIONS = {}
+HTTP_STATS = {}
+HTTP_LOCK = threading.Lock()
+
+#lookup cache settings, persisted to Data/Cache.json between runs
+CACHE_MAX_ENTRIES = 2000
+CACHE_TTLS = {'member': timedelta(days=7), 'bill': timedelta(hours=12)}
+CACHE = None
+CACHE_STATS = {}
+CACHE_DIRTY = False
+CACHE_LOCK = threading.Lock()
+
+#local database for the outbox, one connection per thread
+DATABASE_LOCAL = threading.local()
+
+#publisher settings, tweets are drained from the outbox as fast as the twitter rate bucket allows
+PUBLISH_IDLE_WAIT = 60
+PUBLISH_RETRY_BASE_WAIT = 15
+PUBLISH_RETRY_MAX_WAIT = 900
+PUBLISH_MAX_TRANSIENT_RETRIES = 6
+PUBLISH_AUTH_ERROR_WAIT = 3600
+#a 403 with one of these error codes or v2 problem types is about the account or app, any other 403 is about the tweet
+#suspended, bad token, no access, flagged as automated, read only app, locked, wrong access level
+TWITTER_ACCOUNT_ERROR_CODES = (64, 89, 220, 226, 261, 326, 453)
+TWITTER_ACCOUNT_PROBLEMS = ('client-forbidden', 'client-not-enrolled', 'oauth1-permissions', 'unsupported-authentication')
+PUBLISHER_WAKE = threading.Event()
+PUBLISHER_THREAD = None
+TWITTER_CLIENT = None
+DRY_RUN_PUBLISHER = RecordingPublisher()
+
+#token buckets per api, capacity is the burst size and rate the sustained requests per second
+#rate limit headers from each api pull these down to the real remaining budget
+RATE_LIMITS = {
+    'propublica': {'capacity': 50, 'rate': 5000 / 86400},
+    'cspan': {'capacity': 5, 'rate': 1},
+    'twitter': {'capacity': 50, 'rate': 50 / 3600},
+}
+RATE_HOSTS = {'api.propublica.org': 'propublica', 'www.c-span.org': 'cspan'}
+RATE_BUCKETS = {}
+RATE_LOCK = threading.Lock()
+
+#enrichment settings, per vote lookups run concurrently and the next few votes are prefetched
+ENRICHMENT_WORKERS = 6
+ENRICHMENT_PREFETCH = 3
+ENRICHMENT_POOL = None
+
+#backfill settings
+BACKFILL_WORKERS = 4
+
+#log settings, messages print right away and a writer thread appends them to the log file in batches
+#a new file starts each day, or once the current one passes LOG_MAX_BYTES
+LOG_FLUSH_INTERVAL = 1
+LOG_BATCH_SIZE = 500
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_JSON = False
+LOG_PATH = None
+LOG_QUEUE = queue.Queue()
+LOG_THREAD = None
+LOG_LOCK = threading.Lock()
+
+#metrics settings, latency histograms and counters for the hot paths, served on METRICS_PORT if set
+METRICS_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600)
+METRICS_PORT = None
+METRICS_SUMMARY_INTERVAL = 900
+METRICS_HISTOGRAMS = {}
+METRICS_COUNTERS = {}
+METRICS_GAUGES = {}
+METRICS_LOCK = threading.Lock()
+METRICS_LAST_SUMMARY = 0
+
+#sharding, each process is one shard that polls and posts for its own chambers, optionally as its own account
+#shards share the database and lease the votes and threads they work on, so no two shards take the same roll call
+#a thread is only ever posted by shards posting as the account it was rendered for, '' is the default account
+SHARD_NAME = 'main'
+SHARD_CHAMBERS = (Chamber.HOUSE, Chamber.SENATE)
+SHARD_ACCOUNT = ''
+SHARD_LEASE_SECONDS = 3600
+
+#daemon, a shutdown is asked for by SIGTERM or SIGINT and everything winds down at its next checkpoint
+#the health file is rewritten at least every HEALTH_INTERVAL while the bot is running
+SHUTDOWN = threading.Event()
+SHUTDOWN_TIMEOUT = 60
+HEALTH_INTERVAL = 60
+
+#local mirror of everything downloaded from propublica
+#a day's votes are served from the mirror once the day has settled, when the api has nothing more to add to it
+MIRROR_SETTLED_AFTER = timedelta(days=2)
+
+#member index, both chambers' rosters for the current congress kept in memory and in the database
+#refreshed once a day, the per member endpoint is only used for members it doesn't know
+#a failed refresh is tried again after MEMBER_INDEX_RETRY rather than every maintenance pass
+MEMBER_INDEX = {}
+MEMBER_INDEX_REFRESH = timedelta(days=1)
+MEMBER_INDEX_RETRY = timedelta(hours=1)
+
+#c-span clip settings, a vote without a clip yet is searched again on this schedule and then given up on
+#clips found after the thread posted go out as a reply to it
+CSPAN_RETRY_DELAYS = (600, 1800, 3600, 3 * 3600, 6 * 3600, 12 * 3600)
+CSPAN_RESOLVER_INTERVAL = 300
+CSPAN_CHUNK_SIZE = 16384
+CSPAN_CLIP_PATTERN = re.compile(rb'"//www\.c-span\.org/video/\?[^"\s<>]+"')
+CSPAN_RESOLVER_THREAD = None
+
+#tweet templates, compiled once on first use and rendered to twitter's weighted length limit
+#only the description field is ever shortened to make a tweet fit
+TWEET_MAX_WEIGHTED_LENGTH = 280
+TWEET_URL_LENGTH = 23
+#links the way twitter finds them, a host with a scheme or ending in a known top level domain, then a path that can't end in punctuation
+#a bare domain like congress.gov/bill is wrapped in t.co too, and a full stop or bracket after a link counts on its own
+TWEET_URL_TLDS = ('info', 'news', 'com', 'org', 'net', 'gov', 'edu', 'mil', 'int', 'biz', 'io', 'co', 'us', 'tv', 'me', 'ly', 'uk', 'ca')
+TWEET_URL_PATTERN = re.compile(
+    r'(?<![\w@$#.-])'
+    r'(?:https?://(?:[\w-]+\.)+[\w-]+|(?:[\w-]+\.)+(?:' + '|'.join(TWEET_URL_TLDS) + r')(?![\w-]))'
+    r'(?::\d+)?'
+    r'(?:[/?#](?:[^\s()]|\([^\s()]*\))*(?<![.,:;!?\'"*]))?',
+    re.IGNORECASE)
+TWEET_TEMPLATES = {
+    'speakerVote': '{chamber} Vote {roll_call}\n{description}\n\n{question} {amendment}\n{result}',
+    'amendmentVote': '{chamber} Vote {roll_call}\n{description}\n\n{question} {amendment}\n{result}: {voteText}',
+    'vote': '{chamber} Vote {roll_call}\n{description}\n\n{question}\n{result}: {voteText}',
+    'speakerVotes': '@{bot} Votes:\n{speakerVotes}',
+    'breakdown': '@{bot} Vote Breakdown:\n{democratVotes}\n{republicanVotes}\n\nDetails:\n{voteURL}',
+    'breakdownWithIndependents': '@{bot} Vote Breakdown:\n{democratVotes}\n{republicanVotes}\n{independentVotes}\n\nDetails:\n{voteURL}',
+    'voteDetails': '@{bot} Vote Details:\n{voteURL}',
+    'voteLinks': '@{bot} Vote Links\n\nProPublica: {propublicaLink}\nGovTrack: {govtrackLink}',
+    'voteLinksWithClip': '@{bot} Vote Links\nC-SPAN Clip: {cspanLink}\nProPublica: {propublicaLink}\nGovTrack: {govtrackLink}',
+    'nomination': '@{bot} Nomination {nomination}\nDetails: {nominationLink}',
+    'lateClip': '@{bot} C-SPAN Clip: {cspanLink}',
+    'amendmentDetails': '@{bot} {sponsorText}Amd Details: {description}',
+    'billDetails': '@{bot} {sponsorText}\nBill Details: {billDetailsURL}',
+    'billLinks': '@{bot} Bill Links\nC-SPAN: {cspanBillLink}\nProPublica: {propublicaBillLink}',
+    'billLinksWithGovTrack': '@{bot} Bill Links\nC-SPAN: {cspanBillLink}\nProPublica: {propublicaBillLink}\nGovTrack: {govtrackLink}',
+}
+COMPILED_TEMPLATES = {}
+
+#validators from the last response of each polled url, used to make quiet polls conditional
+POLL_VALIDATORS = {}
+
+#poll scheduling, each chamber has its own timer
+#a chamber with a vote in the last POLL_ACTIVE_WINDOW is polled every POLL_ACTIVE_INTERVAL, otherwise the wait doubles up to POLL_MAX_INTERVAL
+#the active interval is stretched so polling never takes more than POLL_BUDGET_SHARE of the propublica budget, the rest is for enrichment
+#POLL_WINDOWS are cron style (minute hour day month weekday, local time, every field has to match) with the longest wait allowed while they match
+#the windows only hold a chamber to them while it's in session, one that hasn't voted in POLL_SESSION_WINDOW is in recess and backs off all the way
+POLL_ACTIVE_INTERVAL = 30
+POLL_ACTIVE_WINDOW = timedelta(hours=2)
+POLL_SESSION_WINDOW = timedelta(days=5)
+POLL_BUDGET_SHARE = 0.5
+POLL_MAX_INTERVAL = 4 * 3600
+POLL_WINDOWS = [
+    ('* 9-23 * * 1-5', 300),
+]
+POLL_SCHEDULE = {}
+MAINTENANCE_INTERVAL = 300
+
+def observeMetric(name, value):
+    #add a value to a histogram
+    with METRICS_LOCK:
+        histogram = METRICS_HISTOGRAMS.get(name)
+        if histogram == None:
+            histogram = {'buckets': [0] * len(METRICS_BUCKETS), 'sum': 0.0, 'count': 0}
+            METRICS_HISTOGRAMS[name] = histogram
+
+        for index, bound in enumerate(METRICS_BUCKETS):
+            if value <= bound:
+                histogram['buckets'][index] += 1
+                break
+        histogram['sum'] += value
+        histogram['count'] += 1
+
+def countMetric(name, amount=1):
+    with METRICS_LOCK:
+        METRICS_COUNTERS[name] = METRICS_COUNTERS.get(name, 0) + amount
+
+def setMetric(name, value):
+    with METRICS_LOCK:
+        METRICS_GAUGES[name] = value
+
+@contextmanager
+def timed(name):
+    #time a block, or a whole function when used as a decorator, into the name_seconds histogram
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observeMetric(f'{name}_seconds', time.perf_counter() - start)
+
+def getMetricQuantile(histogram, quantile):
+    #upper bound of the bucket the quantile falls in
+    target = histogram['count'] * quantile
+    seen = 0
+    for index, count in enumerate(histogram['buckets']):
+        seen += count
+        if seen >= target and count > 0:
+            return METRICS_BUCKETS[index]
+    return float('inf')
+
+def formatMetrics():
+    #render every metric in the prometheus text format
+    lines = []
+    with METRICS_LOCK:
+        for name, histogram in sorted(METRICS_HISTOGRAMS.items()):
+            lines.append(f'# TYPE bot_{name} histogram')
+            cumulative = 0
+            for bound, count in zip(METRICS_BUCKETS, histogram['buckets']):
+                cumulative += count
+                lines.append(f'bot_{name}_bucket{{le="{bound}"}} {cumulative}')
+            lines.append(f'bot_{name}_bucket{{le="+Inf"}} {histogram["count"]}')
+            lines.append(f'bot_{name}_sum {histogram["sum"]}')
+            lines.append(f'bot_{name}_count {histogram["count"]}')
+        for name, value in sorted(METRICS_COUNTERS.items()):
+            lines.append(f'# TYPE bot_{name} counter')
+            lines.append(f'bot_{name} {value}')
+        typed = set()
+        for name, value in sorted(METRICS_GAUGES.items()):
+            #labelled gauges share one type line
+            baseName = name.split('{')[0]
+            if baseName not in typed:
+                lines.append(f'# TYPE bot_{baseName} gauge')
+                typed.add(baseName)
+            lines.append(f'bot_{name} {value}')
+    return '\n'.join(lines) + '\n'
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    #serves /metrics for prometheus to scrape
+    def do_GET(self):
+        if self.path != '/metrics':
+            self.send_error(404)
+            return
+
+        body = formatMetrics().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def startMetricsServer(port):
+    server = ThreadingHTTPServer(('127.0.0.1', port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='Metrics', daemon=True).start()
+    log(f'Serving metrics on http://127.0.0.1:{port}/metrics')
+
+def logMetricsSummary(force=False):
+    #log count, average and rough percentiles for each histogram, at most once per METRICS_SUMMARY_INTERVAL
+    global METRICS_LAST_SUMMARY
+
+    if not force and CLOCK.monotonic() - METRICS_LAST_SUMMARY < METRICS_SUMMARY_INTERVAL:
+        return
+    METRICS_LAST_SUMMARY = CLOCK.monotonic()
+
+    with METRICS_LOCK:
+        histograms = {name: dict(histogram) for name, histogram in METRICS_HISTOGRAMS.items()}
+        counters = dict(METRICS_COUNTERS)
+    for name, histogram in sorted(histograms.items()):
+        if histogram['count'] > 0:
+            log(f"Metric [{name}]: {histogram['count']} samples, avg {histogram['sum'] / histogram['count']:.2f}, p50 <= {getMetricQuantile(histogram, 0.5)}, p95 <= {getMetricQuantile(histogram, 0.95)}")
+    for name, value in sorted(counters.items()):
+        log(f"Metric [{name}]: {value}")
+
+def getDatabase():
+    #return this thread's connection to the local database, creating the schema on first use
+    connection = getattr(DATABASE_LOCAL, 'connection', None)
+    if connection != None:
+        return connection
+
     path = os.path.join(BASE_PATH, "Data")
     if not os.path.isdir(path):
         os.makedirs(path)
 
-    path = os.path.join(path, "LastPostTimestamp.dat")
-    with open(path, 'w+') as f:
-        f.write(str(timestamp))
+    connection = sqlite3.connect(os.path.join(path, "Bot.db"), timeout=30)
+    connection.row_factory = sqlite3.Row
+    connection.execute('PRAGMA journal_mode=WAL')
+    with connection:
+        connection.executescript('''
+            CREATE TABLE IF NOT EXISTS outbox_threads (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                vote_key TEXT NOT NULL,
+                reply_to TEXT,
+                created TEXT NOT NULL,
+                completed TEXT
+            );
+            CREATE TABLE IF NOT EXISTS outbox_tweets (
+                thread_id INTEGER NOT NULL REFERENCES outbox_threads(id),
+                position INTEGER NOT NULL,
+                text TEXT NOT NULL,
+                stop_embeds INTEGER NOT NULL,
+                tweet_id TEXT,
+                posted TEXT,
+                PRIMARY KEY (thread_id, position)
+            );
+            CREATE INDEX IF NOT EXISTS outbox_threads_pending ON outbox_threads(completed);
+            CREATE TABLE IF NOT EXISTS vote_ledger (
+                chamber TEXT NOT NULL,
+                congress INTEGER NOT NULL,
+                session INTEGER NOT NULL,
+                roll_call INTEGER NOT NULL,
+                vote_time TEXT NOT NULL,
+                state TEXT NOT NULL,
+                vote TEXT NOT NULL,
+                thread_id INTEGER REFERENCES outbox_threads(id),
+                tweets_posted INTEGER NOT NULL DEFAULT 0,
+                detected TEXT NOT NULL,
+                updated TEXT NOT NULL,
+                PRIMARY KEY (chamber, congress, session, roll_call)
+            );
+            CREATE INDEX IF NOT EXISTS vote_ledger_state ON vote_ledger(state);
+            CREATE INDEX IF NOT EXISTS vote_ledger_time ON vote_ledger(vote_time);
+            CREATE INDEX IF NOT EXISTS vote_ledger_thread ON vote_ledger(thread_id);
+            CREATE TABLE IF NOT EXISTS backfill_chunks (
+                chamber TEXT NOT NULL,
+                start_date TEXT NOT NULL,
+                end_date TEXT NOT NULL,
+                completed TEXT NOT NULL,
+                PRIMARY KEY (chamber, start_date, end_date)
+            );
+            CREATE TABLE IF NOT EXISTS cspan_clips (
+                chamber TEXT NOT NULL,
+                congress INTEGER NOT NULL,
+                session INTEGER NOT NULL,
+                roll_call INTEGER NOT NULL,
+                vote_date TEXT NOT NULL,
+                status TEXT NOT NULL,
+                link TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt REAL,
+                thread_id INTEGER REFERENCES outbox_threads(id),
+                PRIMARY KEY (chamber, congress, session, roll_call)
+            );
+            CREATE INDEX IF NOT EXISTS cspan_clips_pending ON cspan_clips(status, next_attempt);
+            CREATE TABLE IF NOT EXISTS members (
+                id TEXT PRIMARY KEY,
+                twitter TEXT,
+                party TEXT,
+                state TEXT,
+                name TEXT,
+                congress INTEGER NOT NULL
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS mirror_votes (
+                chamber TEXT NOT NULL,
+                congress INTEGER NOT NULL,
+                session INTEGER NOT NULL,
+                roll_call INTEGER NOT NULL,
+                vote_date TEXT NOT NULL,
+                vote_time TEXT NOT NULL,
+                bill_id TEXT,
+                sponsor_id TEXT,
+                vote TEXT NOT NULL,
+                PRIMARY KEY (chamber, congress, session, roll_call)
+            );
+            CREATE INDEX IF NOT EXISTS mirror_votes_date ON mirror_votes(vote_date);
+            CREATE INDEX IF NOT EXISTS mirror_votes_chamber ON mirror_votes(chamber, vote_date);
+            CREATE INDEX IF NOT EXISTS mirror_votes_bill ON mirror_votes(bill_id);
+            CREATE INDEX IF NOT EXISTS mirror_votes_sponsor ON mirror_votes(sponsor_id);
+            CREATE TABLE IF NOT EXISTS mirror_days (
+                chamber TEXT NOT NULL,
+                vote_date TEXT NOT NULL,
+                PRIMARY KEY (chamber, vote_date)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS mirror_bills (
+                url TEXT PRIMARY KEY,
+                bill_id TEXT,
+                sponsor_id TEXT,
+                bill TEXT NOT NULL,
+                fetched TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS mirror_bills_bill ON mirror_bills(bill_id);
+            CREATE INDEX IF NOT EXISTS mirror_bills_sponsor ON mirror_bills(sponsor_id);
+            CREATE TABLE IF NOT EXISTS mirror_members (
+                id TEXT PRIMARY KEY,
+                member TEXT NOT NULL,
+                fetched TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS bot_state (
+                name TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+        ''')
+        addColumn(connection, 'outbox_threads', 'chamber', 'TEXT')
+        addColumn(connection, 'outbox_threads', 'claimed_by', 'TEXT')
+        addColumn(connection, 'outbox_threads', 'lease_until', 'REAL')
+        addColumn(connection, 'outbox_threads', 'account', "TEXT NOT NULL DEFAULT ''")
+        addColumn(connection, 'vote_ledger', 'claimed_by', 'TEXT')
+        addColumn(connection, 'vote_ledger', 'lease_until', 'REAL')
+        connection.execute("UPDATE outbox_threads SET chamber = substr(vote_key, 1, instr(vote_key, '-') - 1) WHERE chamber IS NULL")
+
+    DATABASE_LOCAL.connection = connection
+    return connection
+
+def addColumn(db, table, column, definition):
+    #bring a database made by an older version up to date
+    columns = [row['name'] for row in db.execute(f'PRAGMA table_info({table})')]
+    if column not in columns:
+        db.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+def getLedgerCutoff():
+    #votes older than this were handled before the ledger existed and are never posted
+    #carried over from LastPostTimestamp.dat the first time, otherwise the time the ledger was created
+    db = getDatabase()
+    row = db.execute("SELECT value FROM bot_state WHERE name = 'ledger_cutoff'").fetchone()
+    if row != None:
+        return row['value']
 
-def getLastPostTimestamp():
-    #grab the last post timestamp so we know which records (should) have already been posted
     path = os.path.join(BASE_PATH, "Data", "LastPostTimestamp.dat")
-
     if os.path.exists(path):
         with open(path, 'r') as f:
-            date = f.read()
+            cutoff = f.read().strip()
     else:
-        #if no saved date, return current timestamp, move on from here
-        date = datetime.strftime(datetime.now(), "%Y-%m-%d %H:%M:%S")
+        cutoff = datetime.strftime(CLOCK.now(), "%Y-%m-%d %H:%M:%S")
 
-    date = datetime.strptime(date, "%Y-%m-%d %H:%M:%S")
-    log(f'Reading last post timestamp [{str(date)}]')
-    return date
+    with db:
+        db.execute("INSERT OR IGNORE INTO bot_state (name, value) VALUES ('ledger_cutoff', ?)", (cutoff,))
+    log(f'Vote ledger cutoff set to [{cutoff}]')
+    return cutoff
+
+def setVoteState(vote, state):
+    db = getDatabase()
+    with db:
+        db.execute('UPDATE vote_ledger SET state = ?, updated = ? WHERE chamber = ? AND congress = ? AND session = ? AND roll_call = ?', (state, str(CLOCK.now()), *vote.key))
+
+def getUnqueuedVotes():
+    #return this shard's votes recorded in the ledger that never made it into the outbox, oldest first
+    #a vote leased by a shard that has since died is taken over once its lease runs out
+    db = getDatabase()
+    chambers = getShardChamberNames()
+    rows = db.execute(f"SELECT chamber, congress, session, roll_call, vote FROM vote_ledger WHERE state IN ('seen', 'enriched') AND chamber IN ({','.join('?' * len(chambers))}) ORDER BY vote_time, roll_call", chambers).fetchall()
 
-def getVotesInDateRange(startDate: datetime, endDate: datetime):
-    #use api to return voting data in a date range
     votes = []
+    for row in rows:
+        with db:
+            cursor = db.execute("UPDATE vote_ledger SET claimed_by = ?, lease_until = ? WHERE chamber = ? AND congress = ? AND session = ? AND roll_call = ? AND (claimed_by IS NULL OR claimed_by = ? OR lease_until < ?)",
+                                (SHARD_NAME, CLOCK.time() + SHARD_LEASE_SECONDS, row['chamber'], row['congress'], row['session'], row['roll_call'], SHARD_NAME, CLOCK.time()))
+        if cursor.rowcount == 1:
+            votes.append(Vote(json.loads(row['vote'])))
+    return votes
+
+def resumeUnqueuedVotes():
+    #render and queue any unqueued votes we can claim, ours from before a restart or another shard's once its lease runs out
+    unqueuedVotes = getUnqueuedVotes()
+    if len(unqueuedVotes) > 0:
+        log(f'{len(unqueuedVotes)} votes in the ledger were never queued, resuming them...')
+        postNewVotes(unqueuedVotes)
+
+def getShardChamberNames():
+    #chamber names as the api writes them in votes, for the chambers this shard handles
+    return [chamber.value.title() for chamber in SHARD_CHAMBERS]
+
+def getDateRangeChunks(startDate: datetime, endDate: datetime):
+    #split a date range, end date included, into back to back windows of at most 30 days for the api
+    chunks = []
     endDate = endDate + timedelta(1)
+    thisDate = startDate
+    while thisDate < endDate:
+        thisStart = thisDate
+        thisDate += timedelta(30)
+        if thisDate > endDate:
+            thisDate = endDate
+        chunks.append((thisStart, thisDate))
+    return chunks
+
+def getVotesInChunk(startDate: datetime, endDate: datetime, chamber: Chamber = Chamber.BOTH):
+    #use api to return voting data for one window of a date range, newest first
+    #windows the mirror already has in full are read from it instead
+    votes = getMirroredVotes(startDate, endDate, chamber)
+    if votes != None:
+        log(f'Read {len(votes)} votes in date range[{str(startDate)} - {str(endDate)}] from the mirror')
+        countMetric('mirror_range_hits_total')
+        return votes
+
+    log(f'Grabbing votes in date range[{str(startDate)} - {str(endDate)}]')
+    countMetric('mirror_range_misses_total')
+    url = PROPUBLICA_BASE_URL + chamber.value + "/" + Endpoints.VOTES.value + "/" + startDate.strftime("%Y-%m-%d") + "/" + endDate.strftime("%Y-%m-%d") + ".json"
+    votes = proPublicaAPIGetItems(url, 'votes', Vote)
+    if votes != None:
+        mirrorVotes(votes, chamber, startDate, endDate)
+    return votes
 
-    daysBetween = endDate - startDate
-    daysBetween = daysBetween.days
-    if daysBetween > 30:
+def getMirrorChamberNames(chamber: Chamber):
+    if chamber == Chamber.BOTH:
+        return ['House', 'Senate']
+    return [chamber.value.title()]
+
+def getMirrorDays(startDate: datetime, endDate: datetime):
+    #every day in a range, end date included, like the api's ranges
+    days = []
+    day = startDate.date()
+    while day <= endDate.date():
+        days.append(day.strftime("%Y-%m-%d"))
+        day += timedelta(1)
+    return days
+
+def mirrorVotes(votes, chamber: Chamber = None, startDate: datetime = None, endDate: datetime = None):
+    #save votes to the mirror, and if they're everything the api has for a date range, mark the settled days of it as complete
+    #a vote's sponsor is whoever sponsored what was voted on, the amendment if there is one, otherwise the bill
+    db = getDatabase()
+    rows = []
+    for vote in votes:
+        sponsorID = vote.amendment.get('sponsor_id') or vote.bill.get('sponsor_id')
+        rows.append((*vote.key, vote.date, vote.timestamp, vote.bill.get('bill_id'), sponsorID, json.dumps(vote.toJson())))
+
+    with db:
+        db.executemany('INSERT OR REPLACE INTO mirror_votes (chamber, congress, session, roll_call, vote_date, vote_time, bill_id, sponsor_id, vote) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+        if chamber != None:
+            settled = (CLOCK.now() - MIRROR_SETTLED_AFTER).strftime("%Y-%m-%d")
+            days = [day for day in getMirrorDays(startDate, endDate) if day < settled]
+            db.executemany('INSERT OR IGNORE INTO mirror_days (chamber, vote_date) VALUES (?, ?)', [(name, day) for name in getMirrorChamberNames(chamber) for day in days])
+
+def getMirroredVotes(startDate: datetime, endDate: datetime, chamber: Chamber = Chamber.BOTH):
+    #return a date range's votes from the mirror newest first like the api, or None if the mirror doesn't have all of it
+    db = getDatabase()
+    chambers = getMirrorChamberNames(chamber)
+    start = startDate.strftime("%Y-%m-%d")
+    end = endDate.strftime("%Y-%m-%d")
+    placeholders = ','.join('?' * len(chambers))
+    mirrored = db.execute(f'SELECT COUNT(*) FROM mirror_days WHERE chamber IN ({placeholders}) AND vote_date BETWEEN ? AND ?', (*chambers, start, end)).fetchone()[0]
+    if mirrored < len(chambers) * len(getMirrorDays(startDate, endDate)):
+        return None
+
+    rows = db.execute(f'SELECT vote FROM mirror_votes WHERE chamber IN ({placeholders}) AND vote_date BETWEEN ? AND ? ORDER BY vote_time DESC, roll_call DESC', (*chambers, start, end))
+    return [Vote(json.loads(row['vote'])) for row in rows]
+
+def getVotesInDateRange(startDate: datetime, endDate: datetime, chamber: Chamber = Chamber.BOTH):
+    #use api to return voting data in a date range
+    votes = []
+    chunks = getDateRangeChunks(startDate, endDate)
+    if len(chunks) > 1:
         log(f'Date range[{str(startDate)} - {str(endDate)}] is larger than 30 days, splitting up...')
-        thisDate = startDate
-
-        while (thisDate < endDate):
-            thisStart = thisDate
-            thisDate += timedelta(30)
-            if thisDate > endDate:
-                thisDate = endDate
-            
-            log(f'Grabbing votes in date range[{str(thisStart)} - {str(thisDate)}]')
-            url = PROPUBLICA_BASE_URL + Chamber.BOTH.value + "/" + Endpoints.VOTES.value + "/" + thisStart.strftime("%Y-%m-%d") + "/" + thisDate.strftime("%Y-%m-%d") + ".json"
-            votes.extend(proPublicaAPIGet(url)['votes'])
 
-    else:
-        log(f'Grabbing votes in date range[{str(startDate)} - {str(endDate)}]')
-        url = PROPUBLICA_BASE_URL + Chamber.BOTH.value + "/" + Endpoints.VOTES.value + "/" + startDate.strftime("%Y-%m-%d") + "/" + endDate.strftime("%Y-%m-%d") + ".json"
-        votes = proPublicaAPIGet(url)['votes']
+    for thisStart, thisEnd in chunks:
+        chunkVotes = getVotesInChunk(thisStart, thisEnd, chamber)
+        if chunkVotes == None:
+            return None
+        votes.extend(chunkVotes)
 
     return votes
 
-def getRecentVotes():
-    #use api to return recent votes
-    log('Grabbing recent votes...')
-    url = PROPUBLICA_BASE_URL + Chamber.BOTH.value + "/" + Endpoints.VOTES.value + "/recent.json"
-    votes = proPublicaAPIGet(url)
-    return votes
+def iterVotesInDateRange(startDate: datetime, endDate: datetime, chamber: Chamber = Chamber.BOTH, workers=BACKFILL_WORKERS):
+    #yield votes in a date range oldest first, fetching up to workers chunks at once so only those are ever in memory
+    #chunks checkpointed by an earlier run are skipped, and a chunk is checkpointed once all of its votes were consumed
+    #a chunk reaching into days that haven't settled yet, like the mirror's, is never checkpointed since those days can still get votes
+    chunks = [c for c in getDateRangeChunks(startDate, endDate) if not isBackfillChunkDone(chamber, *c)]
+    log(f'Backfilling {len(chunks)} date range chunks with {workers} workers...')
+
+    pending = deque()
+    nextIndex = 0
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='Backfill') as pool:
+        while len(pending) > 0 or nextIndex < len(chunks):
+            while nextIndex < len(chunks) and len(pending) < workers:
+                pending.append((chunks[nextIndex], pool.submit(getVotesInChunk, *chunks[nextIndex], chamber)))
+                nextIndex += 1
+
+            (thisStart, thisEnd), future = pending.popleft()
+            votes = future.result()
+            if votes == None:
+                #stop here, the next run picks up from this chunk
+                log(f'Error - No data returned for date range[{str(thisStart)} - {str(thisEnd)}], stopping backfill...')
+                for _, future in pending:
+                    future.cancel()
+                return
+
+            #each chunk starts on the day the one before it ended, that day's votes were already yielded there
+            if thisStart != startDate:
+                overlapDay = thisStart.strftime("%Y-%m-%d")
+                votes = [v for v in votes if v.date != overlapDay]
+            votes.sort(key=lambda v: (v.timestamp, v.key[3]))
+            yield from votes
+            settled = (CLOCK.now() - MIRROR_SETTLED_AFTER).strftime("%Y-%m-%d")
+            if thisEnd.strftime("%Y-%m-%d") < settled:
+                setBackfillChunkDone(chamber, thisStart, thisEnd)
+
+def isBackfillChunkDone(chamber: Chamber, startDate: datetime, endDate: datetime):
+    db = getDatabase()
+    row = db.execute('SELECT 1 FROM backfill_chunks WHERE chamber = ? AND start_date = ? AND end_date = ?', (chamber.value, startDate.strftime("%Y-%m-%d"), endDate.strftime("%Y-%m-%d"))).fetchone()
+    return row != None
+
+def setBackfillChunkDone(chamber: Chamber, startDate: datetime, endDate: datetime):
+    db = getDatabase()
+    with db:
+        db.execute('INSERT OR IGNORE INTO backfill_chunks (chamber, start_date, end_date, completed) VALUES (?, ?, ?, ?)', (chamber.value, startDate.strftime("%Y-%m-%d"), endDate.strftime("%Y-%m-%d"), str(CLOCK.now())))
+
+def runBackfill(startDate: datetime, endDate: datetime, chamber: Chamber = Chamber.BOTH, workers=BACKFILL_WORKERS, post=False):
+    #record every vote in a date range in the ledger, without posting unless asked to
+    #votes recorded with post set are picked up as unqueued votes the next time the bot starts
+    state = 'seen' if post else 'backfilled'
+    log(f'Backfilling votes in date range[{str(startDate)} - {str(endDate)}] as [{state}]...')
+
+    db = getDatabase()
+    added = 0
+    total = 0
+    for vote in iterVotesInDateRange(startDate, endDate, chamber, workers):
+        now = str(CLOCK.now())
+        with db:
+            cursor = db.execute("INSERT OR IGNORE INTO vote_ledger (chamber, congress, session, roll_call, vote_time, state, vote, detected, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                (*vote.key, vote.timestamp, state, json.dumps(vote.toJson()), now, now))
+        added += cursor.rowcount
+        total += 1
+
+    log(f'Backfill complete, {total} votes read, {added} added to the ledger')
+
+def getRecentVotes(chamber: Chamber = Chamber.BOTH):
+    #use api to return recent votes, returns (modified, results) and skips the download if nothing changed since the last call
+    log(f'Grabbing recent {chamber.value} votes...')
+    url = PROPUBLICA_BASE_URL + chamber.value + "/" + Endpoints.VOTES.value + "/recent.json"
+    return proPublicaAPIGetIfModified(url)
+
+@timed('propublica_request')
+def proPublicaAPIGetIfModified(url):
+    #conditional get against the propublica API, returns (modified, results)
+    #results is None on an error, and (False, None) means the response is the same as last time
+    validators = POLL_VALIDATORS.get(url, {})
+    headers = {'X-API-Key': PROPUBLICA_API_KEY}
+    if 'etag' in validators:
+        headers['If-None-Match'] = validators['etag']
+    if 'lastModified' in validators:
+        headers['If-Modified-Since'] = validators['lastModified']
+
+    r = httpGet(url, headers)
+    if r == None:
+        return True, None
+
+    with r:
+        if r.status_code == 304:
+            return False, None
+        if r.status_code != 200:
+            log(f"API response with status code [{r.status_code}]...")
+            return True, None
+
+        #not every endpoint sends validators, so an identical body also counts as unmodified and skips the parse
+        digest = hashlib.sha1(r.content).hexdigest()
+        if validators.get('digest') == digest:
+            return False, None
+
+        POLL_VALIDATORS[url] = {'digest': digest}
+        if 'ETag' in r.headers:
+            POLL_VALIDATORS[url]['etag'] = r.headers['ETag']
+        if 'Last-Modified' in r.headers:
+            POLL_VALIDATORS[url]['lastModified'] = r.headers['Last-Modified']
+        return True, r.json()['results']
+
+def getChamberHighWater(chamber: Chamber):
+    #return the time of the newest ledger vote for a chamber, or the ledger cutoff if it has none yet
+    db = getDatabase()
+    highWater = db.execute('SELECT MAX(vote_time) FROM vote_ledger WHERE chamber = ? COLLATE NOCASE', (chamber.value,)).fetchone()[0]
+    if highWater == None:
+        highWater = getLedgerCutoff()
+    return highWater
+
+def pollChamber(chamber: Chamber):
+    #return a chamber's votes at or after its high-water mark, newest first like the api
+    #recent.json is the fast path, a date range backfill only runs when it doesn't reach back far enough
+    highWater = getChamberHighWater(chamber)
+    modified, results = getRecentVotes(chamber)
+    if not modified:
+        log(f'No change in recent {chamber.value} votes')
+        return []
+    if results == None:
+        #a request cut short by a shutdown isn't worth falling back from, the next start polls again
+        if SHUTDOWN.is_set():
+            return None
+        log(f"Error - No data returned from recent {chamber.value} votes API request, falling back to date range...")
+        votes = None
+    else:
+        votes = [Vote(v) for v in results['votes']]
+        mirrorVotes(votes)
+
+    #if even the oldest recent vote is past the high-water mark there may be votes we never saw in between
+    if votes == None or (len(votes) > 0 and min(v.timestamp for v in votes) > highWater):
+        if SHUTDOWN.is_set():
+            return None
+        log(f'Recent {chamber.value} votes don\'t reach back to [{highWater}], backfilling date range...')
+        votes = getVotesInDateRange(datetime.strptime(highWater, "%Y-%m-%d %H:%M:%S"), CLOCK.now(), chamber)
+        if votes == None:
+            return None
 
+    return [v for v in votes if v.timestamp >= highWater]
+
+def matchesCronField(field, value, low, high):
+    #one cron field, a comma separated list of *, numbers and ranges, each optionally with a /step
+    for part in field.split(','):
+        step = 1
+        if '/' in part:
+            part, step = part.split('/')
+            step = int(step)
+        if part == '*':
+            start, end = low, high
+        elif '-' in part:
+            start, end = (int(p) for p in part.split('-'))
+        else:
+            start = end = int(part)
+        if start <= value <= end and (value - start) % step == 0:
+            return True
+    return False
+
+def matchesCron(expression, when: datetime):
+    minute, hour, day, month, weekday = expression.split()
+    return (matchesCronField(minute, when.minute, 0, 59) and matchesCronField(hour, when.hour, 0, 23) and
+            matchesCronField(day, when.day, 1, 31) and matchesCronField(month, when.month, 1, 12) and
+            matchesCronField(weekday, (when.weekday() + 1) % 7, 0, 6))
+
+def getPollWindowLimit(when: datetime):
+    #return the longest wait between polls allowed at a given time
+    limit = POLL_MAX_INTERVAL
+    for expression, windowLimit in POLL_WINDOWS:
+        if matchesCron(expression, when):
+            limit = min(limit, windowLimit)
+    return limit
+
+def getActivePollInterval():
+    #the shortest wait between polls of a chamber that this shard's share of the propublica budget can sustain
+    #every chamber polled that often for a whole floor day still leaves the rest of the budget for lookups
+    budget = RATE_LIMITS['propublica']['rate'] * POLL_BUDGET_SHARE
+    return max(POLL_ACTIVE_INTERVAL, math.ceil(len(SHARD_CHAMBERS) / budget))
+
+def schedulePoll(chamber: Chamber, newVotes):
+    #work out when to poll a chamber next from how recently it voted, returns the time as a timestamp
+    activeInterval = getActivePollInterval()
+    schedule = POLL_SCHEDULE.setdefault(chamber, {'interval': activeInterval, 'next': 0})
+    now = CLOCK.time()
+    lastVote = datetime.strptime(getChamberHighWater(chamber), "%Y-%m-%d %H:%M:%S")
+    idle = datetime.fromtimestamp(now) - lastVote
+    if newVotes > 0 or idle < POLL_ACTIVE_WINDOW:
+        schedule['interval'] = activeInterval
+    else:
+        schedule['interval'] = min(schedule['interval'] * 2, POLL_MAX_INTERVAL)
+
+    #while in session, a long backoff is cut short by any window we'd be inside by then
+    wait = schedule['interval']
+    if idle < POLL_SESSION_WINDOW:
+        for minute in range(1, int(wait // 60) + 1):
+            if minute * 60 >= getPollWindowLimit(datetime.fromtimestamp(now + minute * 60)):
+                wait = minute * 60
+                break
+
+    schedule['next'] = now + wait
+    nextPoll = datetime.fromtimestamp(schedule['next']).strftime("%Y-%m-%d %H:%M:%S")
+    setMetric(f'next_poll_timestamp{{chamber="{chamber.value}"}}', round(schedule['next']))
+    setMetric(f'poll_interval_seconds{{chamber="{chamber.value}"}}', wait)
+    db = getDatabase()
+    with db:
+        db.execute('INSERT OR REPLACE INTO bot_state (name, value) VALUES (?, ?)', (f'next_poll_{chamber.value}', nextPoll))
+    log(f'Next {chamber.value} poll at [{nextPoll}], in {wait} seconds', chamber=chamber.value, nextPoll=nextPoll, wait=wait)
+    return schedule['next']
+
+def getNextPollTime():
+    #return the timestamp of the next poll due for any of this shard's chambers, now if one hasn't been scheduled yet
+    return min(POLL_SCHEDULE[chamber]['next'] if chamber in POLL_SCHEDULE else 0 for chamber in SHARD_CHAMBERS)
+
+@timed('propublica_request')
 def proPublicaAPIGet(url):
     #send a get request to the propublica API
     headers = {'X-API-Key': PROPUBLICA_API_KEY}
     log(f"Sending ProPublica API GET Request [{url}]...")
-    with requests.get(url, headers=headers) as r:
+    r = httpGet(url, headers)
+    if r == None:
+        return None
+
+    with r:
         log(f"API response with status code [{r.status_code}]...")
         if r.status_code == 200:
             return r.json()['results']
         else:
             return None
 
-def getNewPostData(lastPost: datetime, votes):
-    #takes a list of votes and the last post timestamp and returns votes after that timestamp
-    log('Parsing out votes since last post...')
+@timed('propublica_request')
+def proPublicaAPIGetItems(url, key, convert):
+    #send a get request to the propublica API and decode the list under key one item at a time as it downloads
+    #each item goes through convert as soon as it's decoded, so the full response is never held in memory
+    headers = {'X-API-Key': PROPUBLICA_API_KEY}
+    log(f"Sending ProPublica API GET Request [{url}]...")
+    r = httpGet(url, headers, stream=True)
+    if r == None:
+        return None
+
+    with r:
+        log(f"API response with status code [{r.status_code}]...")
+        if r.status_code != 200:
+            return None
+        try:
+            return [convert(item) for item in iterJsonArray(r.iter_content(chunk_size=HTTP_STREAM_CHUNK_SIZE), key)]
+        except (ValueError, KeyError, requests.exceptions.RequestException) as e:
+            log(f"Error - Couldn't decode [{key}] from API response: {e}")
+            return None
+
+def iterJsonArray(chunks, key):
+    #yield the items of the first json array named key from a stream of byte chunks
+    #an item is decoded once the chunks reach its end, anything already yielded is dropped from the buffer
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder('utf-8')()
+    marker = f'"{key}"'
+    buffer = ''
+    position = None
+    for chunk in chunks:
+        buffer += text.decode(chunk)
+        if position == None:
+            start = buffer.find(marker)
+            bracket = buffer.find('[', start + len(marker)) if start != -1 else -1
+            if bracket == -1:
+                #keep enough to find the key if it's split across chunks
+                if start == -1:
+                    buffer = buffer[-len(marker):]
+                continue
+            position = bracket + 1
+
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if position >= len(buffer):
+                break
+            if buffer[position] == ']':
+                return
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                #the item runs into the next chunk
+                break
+            yield item
+
+        buffer = buffer[position:]
+        position = 0
+
+    raise ValueError(f'response ended before the end of [{key}]')
+
+def getHTTPSession(host):
+    #return the pooled keep-alive session for a host, creating it on first use
+    with HTTP_LOCK:
+        session = HTTP_SESSIONS.get(host)
+        if session == None:
+            session = PooledSession(host)
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_MAX_CONNECTIONS_PER_HOST, pool_block=True, max_retries=0)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            HTTP_SESSIONS[host] = session
+            HTTP_STATS[host] = {'requests': 0, 'errors': 0, 'retries': 0, 'seconds': 0.0}
+        return session
+
+def httpGet(url, headers=None, stream=False):
+    #send a get request over the host's pooled session, retrying 429/5xx and connection errors with jittered backoff
+    #returns the final response, or None if the host could not be reached at all
+    #offline, every request fails right away so lookups fall back to the mirror
+    if HTTP_OFFLINE:
+        countMetric('http_offline_requests_total')
+        return None
+
+    #nothing new is sent once we're shutting down
+    if SHUTDOWN.is_set():
+        return None
+
+    host = urlparse(url).netloc
+    session = getHTTPSession(host)
+    api = RATE_HOSTS.get(host)
+    attempt = 0
+
+    while True:
+        if api != None:
+            try:
+                rateAcquire(api)
+            except ShutdownError:
+                return None
+
+        #the session counts the request in HTTP_STATS
+        try:
+            r = session.get(url, headers=headers, stream=stream)
+            error = None
+        except requests.exceptions.RequestException as e:
+            r = None
+            error = e
+
+        if r != None and api != None:
+            rateUpdate(api, r.headers)
+
+        if r != None and r.status_code not in HTTP_RETRY_STATUSES:
+            return r
+
+        #no more retries once we're shutting down, the caller treats it like any other failed request
+        if attempt >= HTTP_MAX_RETRIES or SHUTDOWN.is_set():
+            if r == None:
+                log(f"Error - GET request [{url}] failed after {attempt + 1} attempts: {error}")
+            return r
+
+        #back off exponentially with full jitter, honoring retry-after when the server sends one
+        delay = random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * (2 ** attempt)))
+        if r != None:
+            retryAfter = r.headers.get('Retry-After')
+            if retryAfter != None and retryAfter.isdigit():
+                delay = min(HTTP_BACKOFF_MAX, int(retryAfter))
+            log(f"GET request [{url}] returned status code [{r.status_code}], retrying in {delay:.1f} seconds...")
+            r.close()
+        else:
+            log(f"GET request [{url}] failed [{error}], retrying in {delay:.1f} seconds...")
+
+        countMetric('http_retries_total')
+        with HTTP_LOCK:
+            HTTP_STATS[host]['retries'] += 1
+
+        #a rate limited api is held off in its bucket so other callers wait too
+        if r != None and r.status_code == 429 and api != None:
+            rateBlock(api, delay)
+        elif CLOCK.wait(SHUTDOWN, delay):
+            return None
+        attempt += 1
+
+def logHTTPStats():
+    #log per host request counts, latency and how many requests reused a kept-alive connection
+    with HTTP_LOCK:
+        for host, stats in HTTP_STATS.items():
+            if stats['requests'] == 0:
+                continue
+
+            #the pool counts every request it served and every connection it had to open, the difference was reused
+            adapter = HTTP_SESSIONS[host].get_adapter(f'https://{host}/')
+            opened = 0
+            served = 0
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools[key]
+                opened += pool.num_connections
+                served += pool.num_requests
+
+            averageLatency = stats['seconds'] / stats['requests'] * 1000
+            log(f"HTTP [{host}]: {stats['requests']} requests, {stats['retries']} retries, {stats['errors']} errors, avg {averageLatency:.0f} ms, {opened} connections opened, {served - opened} reused")
+
+def getNewPostData(votes):
+    #takes a list of votes and returns the ones not already in the ledger, oldest first, recording them as seen
+    log('Parsing out votes not already in the ledger...')
+    cutoff = getLedgerCutoff()
+    now = str(CLOCK.now())
     newVotes = []
-    for i in range(len(votes) - 1, -1, -1):
-        date = datetime.strptime(votes[i]['date'] + " " + votes[i]['time'], "%Y-%m-%d %H:%M:%S")
-        if date > lastPost:
-            newVotes.append(votes[i])
+    db = getDatabase()
+    with db:
+        for i in range(len(votes) - 1, -1, -1):
+            vote = votes[i]
+            if vote.timestamp < cutoff:
+                continue
+
+            #the primary key makes this a single indexed lookup, only a new vote inserts a row
+            #whichever shard inserts the row holds the vote, any other shard polling the same chamber skips it
+            cursor = db.execute("INSERT OR IGNORE INTO vote_ledger (chamber, congress, session, roll_call, vote_time, state, vote, detected, updated, claimed_by, lease_until) VALUES (?, ?, ?, ?, ?, 'seen', ?, ?, ?, ?, ?)",
+                                (*vote.key, vote.timestamp, json.dumps(vote.toJson()), now, now, SHARD_NAME, CLOCK.time() + SHARD_LEASE_SECONDS))
+            if cursor.rowcount == 1:
+                newVotes.append(vote)
     return newVotes
 
 def getMemberData(memberID):
     #return data for a specific member
+    member = cacheGet('member', memberID)
+    if member != None:
+        return member
+
     log(f'Grabbing member data for member [{memberID}]')
     url = PROPUBLICA_BASE_URL + Endpoints.MEMBERS.value + "/" + memberID + ".json"
     member = proPublicaAPIGet(url)
+    db = getDatabase()
+    if member != None:
+        cachePut('member', memberID, member)
+        with db:
+            db.execute('INSERT OR REPLACE INTO mirror_members (id, member, fetched) VALUES (?, ?, ?)', (memberID, json.dumps(member), str(CLOCK.now())))
+    else:
+        #an old copy is better than nothing if the api is down
+        row = db.execute('SELECT member FROM mirror_members WHERE id = ?', (memberID,)).fetchone()
+        if row != None:
+            log(f'Using mirrored member data for member [{memberID}]')
+            member = json.loads(row['member'])
     return member
 
+def getBillData(url):
+    #return data for a specific bill from its api uri
+    bill = cacheGet('bill', url)
+    if bill != None:
+        return bill
+
+    log(f'Grabbing bill data [{url}]')
+    bill = proPublicaAPIGet(url)
+    db = getDatabase()
+    if bill != None:
+        cachePut('bill', url, bill)
+        if len(bill) > 0:
+            with db:
+                db.execute('INSERT OR REPLACE INTO mirror_bills (url, bill_id, sponsor_id, bill, fetched) VALUES (?, ?, ?, ?, ?)', (url, bill[0].get('bill_id'), bill[0].get('sponsor_id'), json.dumps(bill), str(CLOCK.now())))
+    else:
+        row = db.execute('SELECT bill FROM mirror_bills WHERE url = ?', (url,)).fetchone()
+        if row != None:
+            log(f'Using mirrored bill data [{url}]')
+            bill = json.loads(row['bill'])
+    return bill
+
 def getAmendmentData(congress, number):
     #return data for a specific amendment
     log(f'Grabbing amendment data for amendment [{number}]')
@@ -137,6 +1199,12 @@ def getAmendmentData(congress, number):
 
 def getTwitterHandle(memberID):
     #return twitter handle for specific member
+    member = MEMBER_INDEX.get(memberID)
+    if member != None:
+        countMetric('member_index_hits_total')
+        return member[0]
+
+    countMetric('member_index_misses_total')
     log(f'Grabbing twitter handle for member [{memberID}]')
     sponsor_data = getMemberData(memberID)
 
@@ -149,250 +1217,935 @@ def getTwitterHandle(memberID):
     
     return twitterHandle
 
+def getCurrentCongress(date=None):
+    #each congress starts on january 3rd of an odd year, the 1st started in 1789
+    if date == None:
+        date = CLOCK.now()
+    year = date.year
+    if year % 2 == 1 and (date.month, date.day) < (1, 3):
+        year -= 1
+    return (year - 1789) // 2 + 1
+
+def getMemberInfo(memberID):
+    #return (twitter handle, party, state, name) for a member in the roster index, or None
+    return MEMBER_INDEX.get(memberID)
+
+def loadMemberIndex():
+    #load the saved rosters into memory
+    global MEMBER_INDEX
+
+    db = getDatabase()
+    index = {}
+    for row in db.execute('SELECT id, twitter, party, state, name FROM members'):
+        index[row['id']] = (row['twitter'] or '', row['party'], row['state'], row['name'])
+    MEMBER_INDEX = index
+    log(f'Loaded {len(MEMBER_INDEX)} members into the member index')
+
+def refreshMemberIndex(force=False):
+    #download both chambers' rosters for the current congress if they're more than a day old, only writing members that changed
+    global MEMBER_INDEX
+
+    db = getDatabase()
+    refreshed = db.execute("SELECT value FROM bot_state WHERE name = 'members_refreshed'").fetchone()
+    if not force and refreshed != None and CLOCK.now() - datetime.fromisoformat(refreshed['value']) < MEMBER_INDEX_REFRESH:
+        return
+    failed = db.execute("SELECT value FROM bot_state WHERE name = 'members_refresh_failed'").fetchone()
+    if not force and failed != None and CLOCK.now() - datetime.fromisoformat(failed['value']) < MEMBER_INDEX_RETRY:
+        return
+
+    congress = getCurrentCongress()
+    index = dict(MEMBER_INDEX)
+    changed = []
+    for chamber in (Chamber.HOUSE, Chamber.SENATE):
+        log(f'Grabbing {chamber.value} roster for congress [{congress}]')
+        url = PROPUBLICA_BASE_URL + str(congress) + "/" + chamber.value + "/" + Endpoints.MEMBERS.value + ".json"
+        roster = proPublicaAPIGet(url)
+        if roster == None:
+            log(f"Error - No data returned from {chamber.value} roster API request, keeping the old index...")
+            with db:
+                db.execute("INSERT OR REPLACE INTO bot_state (name, value) VALUES ('members_refresh_failed', ?)", (CLOCK.now().isoformat(),))
+            return
+
+        for member in roster[0]['members']:
+            entry = (member.get('twitter_account') or '', member.get('party'), member.get('state'), f"{member.get('first_name')} {member.get('last_name')}")
+            if index.get(member['id']) != entry:
+                index[member['id']] = entry
+                changed.append((member['id'], *entry, congress))
+
+    with db:
+        db.executemany('INSERT OR REPLACE INTO members (id, twitter, party, state, name, congress) VALUES (?, ?, ?, ?, ?, ?)', changed)
+        db.execute("INSERT OR REPLACE INTO bot_state (name, value) VALUES ('members_refreshed', ?)", (CLOCK.now().isoformat(),))
+        db.execute("DELETE FROM bot_state WHERE name = 'members_refresh_failed'")
+    MEMBER_INDEX = index
+    log(f'Member index refreshed, {len(changed)} of {len(index)} members changed')
+
 def postNewVotes(votes):
-    #for each new vote, create the tweet and post it
-    log('Posting new vote information...')
+    #for each new vote, render its tweet thread and queue it in the outbox for the publisher
+    log('Queueing new vote information...')
 
+    pending = deque()
+    nextIndex = 0
     for i in votes:
-        congress = i['congress']
-        session = i['session']
-        chamber = i['chamber']
-        roll_call = i['roll_call']
+        #anything not queued yet stays in the ledger and is resumed on the next start
+        if SHUTDOWN.is_set():
+            log(f'Shutting down, leaving {len(votes) - votes.index(i)} votes to queue on the next start')
+            break
+
+        #keep lookups for the next few votes running while this one renders and the publisher posts
+        while nextIndex < len(votes) and len(pending) <= ENRICHMENT_PREFETCH:
+            pending.append(startEnrichment(votes[nextIndex]))
+            nextIndex += 1
+
+        with timed('enrichment_wait'):
+            enrichment = finishEnrichment(pending.popleft())
+        setVoteState(i, 'enriched')
+        with timed('render_thread'):
+            thread = buildVoteThread(i, enrichment)
+        with timed('enqueue_thread'):
+            threadID = enqueueThread(i.key, thread)
+        if enrichment.get('cspanLink') in (None, ''):
+            setCSpanClipThread(i.key, threadID)
+        countMetric('votes_queued_total')
+
+        #let the publisher start on it while we render the next one
+        PUBLISHER_WAKE.set()
+
+def getEnrichmentPool():
+    global ENRICHMENT_POOL
+
+    if ENRICHMENT_POOL == None:
+        ENRICHMENT_POOL = ThreadPoolExecutor(max_workers=ENRICHMENT_WORKERS, thread_name_prefix='Enrichment')
+    return ENRICHMENT_POOL
+
+def startEnrichment(i):
+    #fan a vote's independent lookups out to the enrichment pool, returns their futures by name
+    pool = getEnrichmentPool()
+    futures = {}
+
+    futures['cspanLink'] = pool.submit(resolveCSpanClip, i.key, i.when)
+
+    if 'number' in i.amendment and i.amendment['sponsor_id'] != '':
+        futures['amendmentHandle'] = pool.submit(getTwitterHandle, i.amendment['sponsor_id'])
+
+    if 'bill_id' in i.bill and i.bill['api_uri'] != None:
+        futures['bill'] = pool.submit(getBillEnrichment, i.bill['api_uri'])
+
+    return futures
+
+def getBillEnrichment(url):
+    #bill data and its sponsor's twitter handle, the handle needs the bill so these run as one task
+    bill_data = getBillData(url)
+    if bill_data == None:
+        return None
+
+    bill_data = bill_data[0]
+    twitterHandle = ''
+    if bill_data['sponsor_id'] != '':
+        twitterHandle = getTwitterHandle(bill_data['sponsor_id'])
+    return bill_data, twitterHandle
+
+def finishEnrichment(futures):
+    #wait for a vote's lookups, a failed lookup comes back as None so the tweet is built without it
+    enrichment = {}
+    for name, future in futures.items():
+        try:
+            enrichment[name] = future.result()
+        except Exception as e:
+            log(f"Error - Enrichment lookup [{name}] failed: {e}")
+            enrichment[name] = None
+    return enrichment
+
+def buildVoteThread(i, enrichment):
+    #build the full reply chain for a vote from the vote and its enrichment, returns a list of (tweet, stopEmbeds)
+    congress = i.congress
+    session = i.session
+    chamber = i.chamber
+    roll_call = i.roll_call
+
+    log(f'Rendering vote {chamber}-{congress}-{session}-{roll_call}...')
+    
+    #grab bill ID for bill information below
+    if 'bill_id' in i.bill:
+        bill = i.bill['number']
+        description = i.bill['title']
+    else:
+        bill = ''
+        description = i.description
 
-        log(f'Processing vote {chamber}-{congress}-{session}-{roll_call}...')
-        
-        #grab bill ID for bill information below
-        if 'bill_id' in i['bill']:
-            bill = i['bill']['number']
-            description = i['bill']['title']
-        else:
-            bill = ''
-            description = i['description']
-
-        if description == None:
-            description = ''
-
-        #grab amendment information
-        amendment = ''
-        if 'amendment' in i:
-            if 'number' in i['amendment']:
-                amendment = i['amendment']['number']
-                
-        question = i['question']
-        result = i['result']
-
-        speakerVotes = ''
-        voteText = ''
-        if question == 'Election of the Speaker':
-            for speaker in i['total']:
-                votes = i['total'][speaker]
-                if speakerVotes == '':
-                    speakerVotes += f'{speaker} : {votes}'
-                else:
-                    speakerVotes += f'\n{speaker} : {votes}'
-        else:
-            yes_votes = i['total']['yes']
-            no_votes = i['total']['no']
-            not_voting = i['total']['not_voting']
-            present = i['total']['present']
-
-             #build vote string
-            voteText = f'Y-{yes_votes}, N-{no_votes}'
-            if present != 0:
-                voteText += f', P-{present}'
-            if not_voting != 0:
-                voteText += f', NV-{not_voting}'
-
-        #build bill string
-        if bill != '':
-            billText = f'Bill {bill.upper()}: '
-        else:
-            billText = ''
+    if description == None:
+        description = ''
 
-        #build tweet
-        if voteText == '':
-            #this should be a speaker vote
-            tweet = f'{chamber} Vote {roll_call}\n{description}\n\n{question} {amendment}\n{result}'
-        else:
-            if amendment != '':
-                tweet = f'{chamber} Vote {roll_call}\n{description}\n\n{question} {amendment}\n{result}: {voteText}'
-                #check tweet length, make accomadations
-                #may need to take question into account here too, but for now focusing on description
-                if len(tweet) > 255:
-                    tweet = f'{chamber} Vote {roll_call}\n{description[0:len(description) - (len(tweet) - 255)]}\n\n{question}\n{result}: {voteText}'
-            else:
-                tweet = f'{chamber} Vote {roll_call}\n{description}\n\n{question}\n{result}: {voteText}'
-
-        #tweet initial vote tweet, save vote timestamp
-        lastTweet = postTweet(tweet)
-        if POST_TWEETS:
-            saveLastPostTimestamp(datetime.strptime(i['date'] + " " + i['time'], "%Y-%m-%d %H:%M:%S") + timedelta(seconds=1))
-
-        if speakerVotes != '':
-            tweet = f'@{BOT_SCREEN_NAME} Votes:\n{speakerVotes}'
-            lastTweet = postTweet(tweet, lastTweet)
-
-        #now post additional information to a reply of this tweet
-        vote_url = i['url']
-        if speakerVotes == '':
-            democratVotes = "Dem: Y-" + str(i['democratic']['yes']) + ", N-" + str(i['democratic']['no']) + ", P-" + str(i['democratic']['present']) + ", NV-" + str(i['democratic']['not_voting'])
-            republicanVotes = "Rep: Y-" + str(i['republican']['yes']) + ", N-" + str(i['republican']['no']) + ", P-" + str(i['republican']['present']) + ", NV-" + str(i['republican']['not_voting'])
-            independentVotes = "Ind: Y-" + str(i['independent']['yes']) + ", N-" + str(i['independent']['no']) + ", P-" + str(i['independent']['present']) + ", NV-" + str(i['independent']['not_voting'])
+    #grab amendment information
+    amendment = ''
+    if 'number' in i.amendment:
+        amendment = i.amendment['number']
             
-            if independentVotes == "Ind: Y-0, N-0, P-0, NV-0":
-                tweet = f'@{BOT_SCREEN_NAME} Vote Breakdown:\n{democratVotes}\n{republicanVotes}\n\nDetails:\n{vote_url}'
+    question = i.question
+    result = i.result
+
+    speakerVotes = ''
+    voteText = ''
+    if question == 'Election of the Speaker':
+        for speaker in i.total:
+            votes = i.total[speaker]
+            if speakerVotes == '':
+                speakerVotes += f'{speaker} : {votes}'
             else:
-                tweet = f'@{BOT_SCREEN_NAME} Vote Breakdown:\n{democratVotes}\n{republicanVotes}\n{independentVotes}\n\nDetails:\n{vote_url}'
+                speakerVotes += f'\n{speaker} : {votes}'
+    else:
+        yes_votes = i.total['yes']
+        no_votes = i.total['no']
+        not_voting = i.total['not_voting']
+        present = i.total['present']
+
+         #build vote string
+        voteText = f'Y-{yes_votes}, N-{no_votes}'
+        if present != 0:
+            voteText += f', P-{present}'
+        if not_voting != 0:
+            voteText += f', NV-{not_voting}'
+
+    #build tweet
+    voteFields = {'chamber': chamber, 'roll_call': roll_call, 'description': description, 'question': question, 'amendment': amendment, 'result': result, 'voteText': voteText}
+    if voteText == '':
+        #this should be a speaker vote
+        tweet = renderTweet('speakerVote', voteFields)
+    elif amendment != '':
+        tweet = renderTweet('amendmentVote', voteFields)
+    else:
+        tweet = renderTweet('vote', voteFields)
+
+    #initial vote tweet, everything after it is a reply to the tweet before
+    thread = [(tweet, False)]
+
+    if speakerVotes != '':
+        tweet = renderTweet('speakerVotes', {'speakerVotes': speakerVotes})
+        thread.append((tweet, False))
+
+    #now post additional information to a reply of this tweet
+    vote_url = i.url
+    if speakerVotes == '':
+        democratVotes = "Dem: Y-" + str(i.democratic['yes']) + ", N-" + str(i.democratic['no']) + ", P-" + str(i.democratic['present']) + ", NV-" + str(i.democratic['not_voting'])
+        republicanVotes = "Rep: Y-" + str(i.republican['yes']) + ", N-" + str(i.republican['no']) + ", P-" + str(i.republican['present']) + ", NV-" + str(i.republican['not_voting'])
+        independentVotes = "Ind: Y-" + str(i.independent['yes']) + ", N-" + str(i.independent['no']) + ", P-" + str(i.independent['present']) + ", NV-" + str(i.independent['not_voting'])
+        
+        breakdownFields = {'democratVotes': democratVotes, 'republicanVotes': republicanVotes, 'independentVotes': independentVotes, 'voteURL': vote_url}
+        if independentVotes == "Ind: Y-0, N-0, P-0, NV-0":
+            tweet = renderTweet('breakdown', breakdownFields)
         else:
-                tweet = f'@{BOT_SCREEN_NAME} Vote Details:\n{vote_url}'
+            tweet = renderTweet('breakdownWithIndependents', breakdownFields)
+    else:
+        tweet = renderTweet('voteDetails', {'voteURL': vote_url})
+
+    #tweet voting breakdown
+    thread.append((tweet, False))
+
+    #grab propublica vote link:
+    propublicaVoteLink = getPropublicaVoteLink(chamber, congress, roll_call, session)
+
+    #grab c span vote link
+    cspanLink = enrichment.get('cspanLink')
+    if cspanLink == None:
+        cspanLink = ''
+
+    #grab govtrack vote link
+    govtrackVoteLink = getGovTrackVoteLink(congress, i.when, chamber, roll_call)
+
+    linkFields = {'cspanLink': cspanLink, 'propublicaLink': propublicaVoteLink, 'govtrackLink': govtrackVoteLink}
+    if (cspanLink != ''):
+        tweet = renderTweet('voteLinksWithClip', linkFields)
+    else:
+        tweet = renderTweet('voteLinks', linkFields)
+
+    #tweet additional vote information
+    thread.append((tweet, True))
+
+    #grab nomination ID for nomination information below
+    nomination = ''
+    if 'number' in i.nomination:
+        nomination = i.nomination['number']
+
+        #now tweet nomination data if any
+        nominationLink = getCongressNominationLink(congress, nomination)
+        tweet = renderTweet('nomination', {'nomination': nomination, 'nominationLink': nominationLink})
+        thread.append((tweet, True))
+
+    #now tweet amendment information if any
+    if amendment != '':
+        #get sponsor info
+        sponsor = i.amendment['sponsor']
+        sponsor_id = i.amendment['sponsor_id']
+        sponsor_party = i.amendment['sponsor_party']
+        sponsor_state = i.amendment['sponsor_state']
+
+        #the amendment api sometimes leaves the sponsor's party and state out, the roster has them
+        member = getMemberInfo(sponsor_id)
+        if member != None:
+            if not sponsor_party:
+                sponsor_party = member[1]
+            if not sponsor_state:
+                sponsor_state = member[2]
+
+        twitterHandle = enrichment.get('amendmentHandle')
+        if twitterHandle == None:
+            twitterHandle = ''
+
+        #build sponsor info
+        sponsorText = ''
+        if (sponsor_id != ''):
+            if (twitterHandle != ''):
+                sponsorText = f'Amd Sponsor: .@{twitterHandle} {sponsor_party}, {sponsor_state}\n'
+            else:
+                sponsorText = f'Amd Sponsor: {sponsor}, {sponsor_party}, {sponsor_state}\n'
 
-        #tweet voting breakdown
-        lastTweet = postTweet(tweet, lastTweet)
+        #amendment data doesn't seem to be returning from the api properly, so we'll leave this for now
+        #info = getAmendmentData(congress, amendment)
 
-        #grab propublica vote link:
-        propublicaVoteLink = getPropublicaVoteLink(chamber, congress, roll_call, session)
+        amendmentDescription = i.description
 
-        #grab c span vote link
-        date = datetime.strptime(i['date'] + " " + i['time'], "%Y-%m-%d %H:%M:%S")
-        cspanLink = getCSpanClipLink(chamber, congress, roll_call, date)
-        if cspanLink == None:
-            cspanLink = ''
+        #tweet amendment information
+        tweet = renderTweet('amendmentDetails', {'sponsorText': sponsorText, 'description': amendmentDescription})
+        thread.append((tweet, False))
 
-        #grab govtrack vote link
-        govtrackVoteLink = getGovTrackVoteLink(congress, date, chamber, roll_call)
+    #now post bill data if any
+    if bill != '':
+        bill_url = i.bill['api_uri']
 
-        tweet = f'@{BOT_SCREEN_NAME} Vote Links\n'
-        if (cspanLink != ''):
-            tweet = f'{tweet}C-SPAN Clip: {cspanLink}'
-        tweet = f'{tweet}\nProPublica: {propublicaVoteLink}'
-        tweet = f'{tweet}\nGovTrack: {govtrackVoteLink}'
+        govtrack_url = ''
+        if bill_url != None and enrichment.get('bill') != None:
+            bill_data, twitterHandle = enrichment['bill']
+            bill_details_url = bill_data['congressdotgov_url']
+            bill_sponsor = bill_data['sponsor_title'] + " " + bill_data['sponsor']
+            bill_sponsor_id = bill_data['sponsor_id']
+            govtrack_url = bill_data['govtrack_url']
         
-        #tweet additional vote information
-        lastTweet = postTweet(tweet, lastTweet, True)
-
-        #grab nomination ID for nomination information below
-        nomination = ''
-        if 'nomination' in i:
-            if 'number' in i['nomination']:
-                nomination = i['nomination']['number']
-
-                #now tweet nomination data if any
-                nominationLink = getCongressNominationLink(congress, nomination)
-                tweet = f'@{BOT_SCREEN_NAME} Nomination {nomination}\nDetails: {nominationLink}'
-                lastTweet = postTweet(tweet, lastTweet, True)
-
-        #now tweet amendment information if any
-        if amendment != '':
-            #get sponsor info
-            sponsor = i['amendment']['sponsor']
-            sponsor_id = i['amendment']['sponsor_id']
-            sponsor_party = i['amendment']['sponsor_party']
-            sponsor_state = i['amendment']['sponsor_state']
-            twitterHandle = getTwitterHandle(sponsor_id)
-
-            #build sponsor info
+            #now build the tweet
             sponsorText = ''
-            if (sponsor_id != ''):
+            if (bill_sponsor_id != ''):
                 if (twitterHandle != ''):
-                    sponsorText = f'Amd Sponsor: .@{twitterHandle} {sponsor_party}, {sponsor_state}\n'
+                    sponsorText = f'Bill Sponsor: .@{twitterHandle}\n'
                 else:
-                    sponsorText = f'Amd Sponsor: {sponsor}, {sponsor_party}, {sponsor_state}\n'
-
-            #amendment data doesn't seem to be returning from the api properly, so we'll leave this for now
-            #info = getAmendmentData(congress, amendment)
-
-            amendmentDescription = i['description']
-
-            #tweet amendment information
-            tweet = f'@{BOT_SCREEN_NAME} {sponsorText}Amd Details: {amendmentDescription}'
-            if len(tweet) > 255:
-                tweet = tweet[0:251] + '...'
-            lastTweet = postTweet(tweet, lastTweet)
-
-        #now post bill data if any
-        if bill != '':
-            bill_url = i['bill']['api_uri']
-
-            govtrack_url = ''
-            if bill_url != None:
-                bill_data = proPublicaAPIGet(bill_url)
-                bill_data = bill_data[0]
-                bill_details_url = bill_data['congressdotgov_url']
-                bill_sponsor = bill_data['sponsor_title'] + " " + bill_data['sponsor']
-                bill_sponsor_id = bill_data['sponsor_id']
-                govtrack_url = bill_data['govtrack_url']
-                
-                #if sponsored, get sponsor information
-                twitterHandle = getTwitterHandle(bill_sponsor_id)
-            
-                #now build the tweet
-                sponsorText = ''
-                if (bill_sponsor_id != ''):
-                    if (twitterHandle != ''):
-                        sponsorText = f'Bill Sponsor: .@{twitterHandle}\n'
-                    else:
-                        sponsorText = f'Bill Sponsor: {bill_sponsor}\n'
-            
-                #tweet bill information
-                tweet = f'@{BOT_SCREEN_NAME} {sponsorText}\nBill Details: {bill_details_url}'
-                lastTweet = postTweet(tweet, lastTweet)
-        
-            #grab c span bill link
-            bill_number = i['bill']['number']
-            cpanBillLink = getCSpanBillLink(congress, bill_number)
-
-            #grab propublica bill link
-            propublicaBillLink = getPropublicaBillLink(congress, bill_number)
-
-            #tweet additional bill links
-            if govtrack_url == '':
-                tweet = f'@{BOT_SCREEN_NAME} Bill Links\nC-SPAN: {cpanBillLink}\nProPublica: {propublicaBillLink}'
-            else:
-                tweet = f'@{BOT_SCREEN_NAME} Bill Links\nC-SPAN: {cpanBillLink}\nProPublica: {propublicaBillLink}\nGovTrack: {govtrack_url}'
-            lastTweet = postTweet(tweet, lastTweet, True)
+                    sponsorText = f'Bill Sponsor: {bill_sponsor}\n'
         
-        log(f"Waiting for 300 seconds...")
-        time.sleep(300)
-
-def postTweet(tweet, replyToID=None, stopEmbeds=False):
-    sleep_time = 60
-    posted = False
+            #tweet bill information
+            tweet = renderTweet('billDetails', {'sponsorText': sponsorText, 'billDetailsURL': bill_details_url})
+            thread.append((tweet, False))
+    
+        #grab c span bill link
+        bill_number = i.bill['number']
+        cpanBillLink = getCSpanBillLink(congress, bill_number)
 
-    log(f"Waiting for 10 seconds...")
-    time.sleep(10)
+        #grab propublica bill link
+        propublicaBillLink = getPropublicaBillLink(congress, bill_number)
 
+        #tweet additional bill links
+        billLinkFields = {'cspanBillLink': cpanBillLink, 'propublicaBillLink': propublicaBillLink, 'govtrackLink': govtrack_url}
+        if govtrack_url == '':
+            tweet = renderTweet('billLinks', billLinkFields)
+        else:
+            tweet = renderTweet('billLinksWithGovTrack', billLinkFields)
+        thread.append((tweet, True))
+
+    return thread
+
+def getWeightedLength(text):
+    #length of text the way twitter counts it, every link counts as a t.co link
+    length = 0
+    position = 0
+    for match in TWEET_URL_PATTERN.finditer(text):
+        length += getCharacterWeight(text[position:match.start()]) + TWEET_URL_LENGTH
+        position = match.end()
+    return length + getCharacterWeight(text[position:])
+
+def getCharacterWeight(text):
+    #latin and general punctuation count once, everything else (cjk, emoji) counts twice
+    if text.isascii():
+        return len(text)
+
+    weight = 0
+    for character in text:
+        code = ord(character)
+        if code <= 4351 or 8192 <= code <= 8205 or 8208 <= code <= 8223 or 8242 <= code <= 8247:
+            weight += 1
+        else:
+            weight += 2
+    return weight
+
+def fitText(text, budget):
+    #shorten text to a weighted length budget with a trailing ellipsis, never cutting through a link
+    if getWeightedLength(text) <= budget:
+        return text
+    if budget < 3:
+        return ''
+
+    budget -= 3
+    pieces = []
+    position = 0
+    for match in itertools.chain(TWEET_URL_PATTERN.finditer(text), [None]):
+        end = len(text) if match == None else match.start()
+        for character in text[position:end]:
+            weight = getCharacterWeight(character)
+            if weight > budget:
+                return ''.join(pieces).rstrip() + '...'
+            budget -= weight
+            pieces.append(character)
+
+        if match == None or TWEET_URL_LENGTH > budget:
+            return ''.join(pieces).rstrip() + '...'
+        budget -= TWEET_URL_LENGTH
+        pieces.append(match.group())
+        position = match.end()
+
+def getCompiledTemplate(name):
+    #split a template into (literal, literal weight, field) parts the first time it's used
+    compiled = COMPILED_TEMPLATES.get(name)
+    if compiled == None:
+        compiled = [(literal, getWeightedLength(literal), field) for literal, field, _, _ in string.Formatter().parse(TWEET_TEMPLATES[name])]
+        COMPILED_TEMPLATES[name] = compiled
+    return compiled
+
+def renderTweet(name, fields):
+    #render a tweet template in one pass, giving the description whatever room the rest of the tweet leaves
+    fields = dict(fields, bot=BOT_SCREEN_NAME)
+    parts = getCompiledTemplate(name)
+
+    fixedLength = 0
+    values = []
+    for literal, literalLength, field in parts:
+        fixedLength += literalLength
+        if field == None:
+            values.append('')
+        elif field == 'description':
+            values.append(None)
+        else:
+            value = str(fields[field])
+            fixedLength += getWeightedLength(value)
+            values.append(value)
+
+    description = unicodedata.normalize('NFC', str(fields.get('description') or ''))
+    description = fitText(description, TWEET_MAX_WEIGHTED_LENGTH - fixedLength)
+    tweet = ''.join(literal + (description if value == None else value) for (literal, _, _), value in zip(parts, values))
+
+    #only happens if the fixed parts alone are too long
+    if getWeightedLength(tweet) > TWEET_MAX_WEIGHTED_LENGTH:
+        log(f"Warning: Tweet [{tweet}] is longer than {TWEET_MAX_WEIGHTED_LENGTH} even without a description")
+        tweet = fitText(tweet, TWEET_MAX_WEIGHTED_LENGTH)
+    return tweet
+
+def loadTweepy():
+    global tweepy
+
+    if tweepy == None:
+        import tweepy
+    return tweepy
+
+def loadHumanize():
+    global humanize
+
+    if humanize == None:
+        import humanize
+    return humanize
+
+def getTwitterClient():
+    #one authenticated client for the life of the process, posting over a pooled keep-alive session
+    #the session bounds every post with HTTP_TIMEOUT and counts it in HTTP_STATS like any other host
+    #raw responses so we can read the rate limit headers
+    global TWITTER_CLIENT
+
+    if TWITTER_CLIENT == None:
+        loadTweepy()
+        TWITTER_CLIENT = tweepy.Client(consumer_key=TWITTER_CONSUMER_KEY, consumer_secret=TWITTER_CONSUMER_SECRET, access_token=TWITTER_TOKEN, access_token_secret=TWITTER_TOKEN_SECRET, return_type=requests.Response)
+        #keep any default headers tweepy gave its own session, like its user agent
+        session = getHTTPSession('api.twitter.com')
+        session.headers.update(TWITTER_CLIENT.session.headers)
+        TWITTER_CLIENT.session = session
+    return TWITTER_CLIENT
+
+@timed('post_tweet')
+def postTweet(tweet, replyToID=None, stopEmbeds=False, threadID=None):
     #post a tweet, return tweet ID
+    #returns None when twitter will never take the tweet (duplicate or rejected content)
+    #account and auth errors are raised right away as TwitterAccountError, transient errors once they've been retried PUBLISH_MAX_TRANSIENT_RETRIES times
+    #for a tweet in an outbox thread, the thread's lease is renewed right before every attempt, after any rate limit wait
     if replyToID != None:
         log(f"Posting tweet [{tweet}] in reply to tweet [{replyToID}]")
     else:
         log(f"Posting tweet [{tweet}]")
 
-    if len(tweet) > 255:
-        log(f"Warning: Tweet [{tweet}] is greater than 255 characters")
-        #shortening tweet
-        tweet = tweet.replace("On Motion to ", "")
-        tweet = tweet.replace("Suspend the Rules and ", "")
-        tweet = tweet[0:252]
-        tweet += '...'
-    
-    while not posted:
-        if POST_TWEETS:
-            client = tweepy.Client(consumer_key=TWITTER_CONSUMER_KEY, consumer_secret=TWITTER_CONSUMER_SECRET, access_token=TWITTER_TOKEN, access_token_secret=TWITTER_TOKEN_SECRET)
-            #if stopEmbeds:
-            #    response = client.create_tweet(in_reply_to_tweet_id=replyToID, text=tweet)
-            #else:
-            #    response = client.create_tweet(in_reply_to_tweet_id=replyToID, text=tweet)
-            try:
-                response = client.create_tweet(in_reply_to_tweet_id=replyToID, text=tweet)
-                posted = True
-            except Exception as e:
-                log(e)
-                log(f"Waiting for {sleep_time} seconds...")
-                time.sleep(sleep_time)
-                sleep_time *= 2
+    if not POST_TWEETS:
+        if threadID != None and not renewThreadLease(threadID):
+            raise LeaseLostError(threadID)
+        return DRY_RUN_PUBLISHER.post(tweet, replyToID, stopEmbeds)
+
+    client = getTwitterClient()
+    rateLimitWait = PUBLISH_RETRY_BASE_WAIT
+    transientErrors = 0
+    while True:
+        #if stopEmbeds:
+        #    response = client.create_tweet(in_reply_to_tweet_id=replyToID, text=tweet)
+        #else:
+        #    response = client.create_tweet(in_reply_to_tweet_id=replyToID, text=tweet)
+        rateAcquire('twitter')
+        if threadID != None and not renewThreadLease(threadID):
+            raise LeaseLostError(threadID)
+        try:
+            response = client.create_tweet(in_reply_to_tweet_id=replyToID, text=tweet)
+            rateUpdate('twitter', response.headers)
+            return response.json()['data']['id']
+        except tweepy.errors.TooManyRequests as e:
+            countMetric('tweet_rate_limited_total')
+            #the bucket holds off the next attempt until the reset time twitter gave us
+            log(e)
+            if not rateUpdate('twitter', e.response.headers):
+                rateBlock('twitter', rateLimitWait)
+                rateLimitWait = min(rateLimitWait * 2, PUBLISH_RETRY_MAX_WAIT)
+        except (tweepy.errors.TwitterServerError, requests.exceptions.RequestException) as e:
+            countMetric('tweet_transient_errors_total')
+            transientErrors += 1
+            if transientErrors > PUBLISH_MAX_TRANSIENT_RETRIES:
+                raise
+
+            delay = random.uniform(0, min(PUBLISH_RETRY_MAX_WAIT, PUBLISH_RETRY_BASE_WAIT * (2 ** transientErrors)))
+            log(e)
+            log(f"Waiting for {delay:.0f} seconds...")
+            if CLOCK.wait(SHUTDOWN, delay):
+                raise ShutdownError('twitter')
+        except tweepy.errors.HTTPException as e:
+            #anything else is either the account, which holds up every tweet, or this tweet, which fails its thread
+            #a deleted or hidden reply target comes back as a 403 or 404
+            if isTwitterAccountError(e):
+                raise TwitterAccountError(e) from e
+            if 'duplicate' in str(e).lower():
+                countMetric('tweet_duplicate_total')
+                log(f"Error - Twitter rejected tweet as duplicate content: {e}")
+            else:
+                countMetric('tweet_rejected_total')
+                log(f"Error - Twitter rejected tweet: {e}")
+            return None
+
+def isTwitterAccountError(e):
+    #whether twitter refused a request because of our credentials, account or app rather than its content
+    status = e.response.status_code
+    if status in (401, 402):
+        return True
+    if status != 403:
+        return False
+    if any(code in TWITTER_ACCOUNT_ERROR_CODES for code in e.api_codes):
+        return True
+
+    try:
+        body = e.response.json()
+    except ValueError:
+        return False
+    if not isinstance(body, dict):
+        return False
+    problem = f"{body.get('type', '')} {body.get('reason', '')}"
+    return any(name in problem for name in TWITTER_ACCOUNT_PROBLEMS)
+
+def getRateBucket(api):
+    #return the token bucket for an api, topped up for the time since it was last used
+    #must be called with RATE_LOCK held
+    now = CLOCK.monotonic()
+    bucket = RATE_BUCKETS.get(api)
+    if bucket == None:
+        bucket = {'tokens': RATE_LIMITS[api]['capacity'], 'updated': now, 'blockedUntil': 0}
+        RATE_BUCKETS[api] = bucket
+
+    limits = RATE_LIMITS[api]
+    bucket['tokens'] = min(limits['capacity'], bucket['tokens'] + (now - bucket['updated']) * limits['rate'])
+    bucket['updated'] = now
+    return bucket
+
+def rateAcquire(api):
+    #wait until the api's bucket has a token and take it
+    #raises ShutdownError if a shutdown comes while waiting
+    while True:
+        with RATE_LOCK:
+            bucket = getRateBucket(api)
+            now = CLOCK.monotonic()
+            if bucket['blockedUntil'] > now:
+                wait = bucket['blockedUntil'] - now
+            elif bucket['tokens'] >= 1:
+                bucket['tokens'] -= 1
+                return
+            else:
+                wait = (1 - bucket['tokens']) / RATE_LIMITS[api]['rate']
+
+        log(f"Waiting for {wait:.1f} seconds for {api} rate budget...")
+        if CLOCK.wait(SHUTDOWN, wait):
+            raise ShutdownError(api)
+
+def rateUpdate(api, headers):
+    #sync the api's bucket with the rate limit headers on a response, returns True if the headers had a reset time
+    remaining = headers.get('x-rate-limit-remaining', headers.get('x-ratelimit-remaining'))
+    reset = headers.get('x-rate-limit-reset', headers.get('x-ratelimit-reset'))
+    if remaining == None or not remaining.isdigit():
+        return False
+
+    with RATE_LOCK:
+        bucket = getRateBucket(api)
+        bucket['tokens'] = min(bucket['tokens'], int(remaining))
+        if reset == None or not reset.isdigit():
+            return False
+
+        #reset is an epoch time, convert it to the monotonic clock the buckets run on
+        resetIn = max(0, int(reset) - CLOCK.time())
+        if int(remaining) == 0:
+            bucket['blockedUntil'] = max(bucket['blockedUntil'], CLOCK.monotonic() + resetIn)
+        return True
+
+def rateBlock(api, seconds):
+    #hold off all calls to an api for a while, used when it rate limits us without telling us until when
+    with RATE_LOCK:
+        bucket = getRateBucket(api)
+        bucket['blockedUntil'] = max(bucket['blockedUntil'], CLOCK.monotonic() + seconds)
+
+def updateStatusMetrics():
+    #gauges for the remaining rate budgets and the outbox backlog
+    for api, budget in getRateBudget().items():
+        setMetric(f'rate_budget_tokens{{api="{api}"}}', round(budget['tokens'], 2))
+        setMetric(f'rate_budget_blocked_seconds{{api="{api}"}}', round(budget['blocked'], 1))
+
+    db = getDatabase()
+    setMetric('outbox_pending_tweets', db.execute('SELECT COUNT(*) FROM outbox_tweets WHERE tweet_id IS NULL').fetchone()[0])
+    oldest = db.execute("SELECT MIN(detected) FROM vote_ledger WHERE state NOT IN ('complete', 'backfilled')").fetchone()[0]
+    setMetric('oldest_unposted_vote_seconds', 0 if oldest == None else round((CLOCK.now() - datetime.fromisoformat(oldest)).total_seconds()))
+
+def getRateBudget():
+    #return the remaining tokens and seconds blocked for every api used so far
+    budget = {}
+    with RATE_LOCK:
+        for api in RATE_BUCKETS:
+            bucket = getRateBucket(api)
+            budget[api] = {'tokens': bucket['tokens'], 'blocked': max(0, bucket['blockedUntil'] - CLOCK.monotonic())}
+    return budget
+
+def logRateBudget():
+    for api, budget in getRateBudget().items():
+        log(f"Rate budget [{api}]: {budget['tokens']:.1f}/{RATE_LIMITS[api]['capacity']} tokens, blocked for {budget['blocked']:.0f} seconds")
+
+def getCachePath():
+    return os.path.join(BASE_PATH, "Data", "Cache.json")
+
+def loadCache():
+    #load the lookup cache from disk, dropping anything that expired while we were down
+    global CACHE
+
+    CACHE = OrderedDict()
+    path = getCachePath()
+    if os.path.exists(path):
+        try:
+            with open(path, 'r') as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            log(f"Error - Could not read lookup cache, starting empty: {e}")
+            entries = []
+
+        now = CLOCK.time()
+        for key, expires, value in entries:
+            if expires > now:
+                CACHE[key] = (expires, value)
+    log(f'Loaded {len(CACHE)} lookup cache entries')
+
+def cacheGet(kind, key):
+    #return a cached lookup, or None if missing or expired
+    with CACHE_LOCK:
+        if CACHE == None:
+            loadCache()
+
+        stats = CACHE_STATS.setdefault(kind, {'hits': 0, 'misses': 0})
+        cacheKey = f'{kind}:{key}'
+        entry = CACHE.get(cacheKey)
+        if entry == None or entry[0] <= CLOCK.time():
+            stats['misses'] += 1
+            return None
 
-    return response.data['id']
+        CACHE.move_to_end(cacheKey)
+        stats['hits'] += 1
+        return entry[1]
+
+def cachePut(kind, key, value):
+    #cache a lookup for its kind's ttl, evicting the least recently used entries past the size limit
+    global CACHE_DIRTY
+
+    with CACHE_LOCK:
+        if CACHE == None:
+            loadCache()
+
+        cacheKey = f'{kind}:{key}'
+        CACHE[cacheKey] = (CLOCK.time() + CACHE_TTLS[kind].total_seconds(), value)
+        CACHE.move_to_end(cacheKey)
+        while len(CACHE) > CACHE_MAX_ENTRIES:
+            CACHE.popitem(last=False)
+        CACHE_DIRTY = True
+
+def saveCache():
+    #write the lookup cache to disk if it changed, replacing the old file in one step
+    global CACHE_DIRTY
+
+    with CACHE_LOCK:
+        if not CACHE_DIRTY:
+            return
+
+        path = os.path.join(BASE_PATH, "Data")
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        path = getCachePath()
+        entries = [[key, expires, value] for key, (expires, value) in CACHE.items()]
+        #every shard saves the same cache file, so each writes its own temporary file
+        tempPath = f'{path}.{os.getpid()}.tmp'
+        with open(tempPath, 'w') as f:
+            json.dump(entries, f)
+        os.replace(tempPath, path)
+        CACHE_DIRTY = False
+
+def logCacheStats():
+    with CACHE_LOCK:
+        for kind, stats in CACHE_STATS.items():
+            log(f"Cache [{kind}]: {stats['hits']} hits, {stats['misses']} misses")
+        if CACHE != None:
+            log(f"Cache size: {len(CACHE)}/{CACHE_MAX_ENTRIES} entries")
+
+def enqueueThread(voteKey, thread, replyToID=None, shard=None):
+    #store a fully rendered reply chain in the outbox and mark the vote queued in the ledger, returns the outbox thread id
+    #a thread replying to an earlier one is a follow up, the vote's ledger entry stays with its original thread
+    #an original thread is rendered for this shard's account, so it's leased to this shard from the start
+    #a thread given a shard is held for it with no lease, so a follow up is posted by the account that posted the original
+    if shard != None:
+        claimedBy, leaseUntil = shard, None
+    else:
+        claimedBy, leaseUntil = SHARD_NAME, CLOCK.time() + SHARD_LEASE_SECONDS
+
+    db = getDatabase()
+    with db:
+        cursor = db.execute('INSERT INTO outbox_threads (vote_key, chamber, reply_to, created, claimed_by, lease_until, account) VALUES (?, ?, ?, ?, ?, ?, ?)', ('-'.join(str(k) for k in voteKey), voteKey[0], replyToID, str(CLOCK.now()), claimedBy, leaseUntil, SHARD_ACCOUNT))
+        threadID = cursor.lastrowid
+        db.executemany('INSERT INTO outbox_tweets (thread_id, position, text, stop_embeds) VALUES (?, ?, ?, ?)',
+                       [(threadID, position, tweet, int(stopEmbeds)) for position, (tweet, stopEmbeds) in enumerate(thread)])
+        if replyToID == None:
+            db.execute("UPDATE vote_ledger SET state = 'queued', thread_id = ?, updated = ? WHERE chamber = ? AND congress = ? AND session = ? AND roll_call = ?", (threadID, str(CLOCK.now()), *voteKey))
+
+    log(f'Queued {len(thread)} tweets for vote [{voteKey}] as outbox thread [{threadID}]', vote='-'.join(str(k) for k in voteKey), thread=threadID, tweets=len(thread))
+    return threadID
+
+def getNextOutboxThread():
+    #claim the oldest thread in this shard's chambers with tweets left to post, or return None if there isn't one
+    #the claim only succeeds if no other shard got there first, otherwise try the next thread
+    #a thread rendered for another account is left to a shard posting as that account, even once its lease runs out
+    db = getDatabase()
+    chambers = getShardChamberNames()
+    while True:
+        now = CLOCK.time()
+        thread = db.execute(f'SELECT id, vote_key, reply_to FROM outbox_threads WHERE completed IS NULL AND chamber IN ({",".join("?" * len(chambers))}) AND account = ? AND (claimed_by IS NULL OR claimed_by = ? OR lease_until < ?) ORDER BY id LIMIT 1',
+                            (*chambers, SHARD_ACCOUNT, SHARD_NAME, now)).fetchone()
+        if thread == None:
+            return None
 
+        with db:
+            cursor = db.execute('UPDATE outbox_threads SET claimed_by = ?, lease_until = ? WHERE id = ? AND completed IS NULL AND account = ? AND (claimed_by IS NULL OR claimed_by = ? OR lease_until < ?)',
+                                (SHARD_NAME, now + SHARD_LEASE_SECONDS, thread['id'], SHARD_ACCOUNT, SHARD_NAME, now))
+        if cursor.rowcount == 1:
+            return thread
+
+def releaseThreadLease(threadID):
+    #let any shard take a thread over right away
+    db = getDatabase()
+    with db:
+        db.execute('UPDATE outbox_threads SET lease_until = 0 WHERE id = ? AND claimed_by = ?', (threadID, SHARD_NAME))
+
+def renewThreadLease(threadID):
+    #extend this shard's lease on a thread, returns False if another shard has taken it over
+    db = getDatabase()
+    with db:
+        cursor = db.execute('UPDATE outbox_threads SET lease_until = ? WHERE id = ? AND claimed_by = ?', (CLOCK.time() + SHARD_LEASE_SECONDS, threadID, SHARD_NAME))
+    return cursor.rowcount == 1
+
+def publishOutbox():
+    #post queued threads in order until the outbox is empty or we're shutting down
+    while not SHUTDOWN.is_set():
+        thread = getNextOutboxThread()
+        if thread == None:
+            return
+        publishThread(thread)
+
+def publishThread(thread):
+    #post the rest of a thread as one unit, each reply going out as soon as the tweet before it has an id
+    #every tweet id is checkpointed as it posts so a restart picks up at the next tweet
+    db = getDatabase()
+    threadID = thread['id']
+    tweets = db.execute('SELECT position, text, stop_embeds, tweet_id FROM outbox_tweets WHERE thread_id = ? ORDER BY position', (threadID,)).fetchall()
+
+    replyToID = thread['reply_to']
+    start = time.perf_counter()
+    postedCount = 0
+    for tweet in tweets:
+        if tweet['tweet_id'] != None:
+            replyToID = tweet['tweet_id']
+            continue
+
+        #every posted tweet is already checkpointed, so stop here and let the next start or another shard pick the thread up
+        try:
+            if SHUTDOWN.is_set():
+                raise ShutdownError(threadID)
+            tweetID = postTweet(tweet['text'], replyToID, bool(tweet['stop_embeds']), threadID)
+        except ShutdownError:
+            releaseThreadLease(threadID)
+            log(f"Shutting down, outbox thread [{threadID}] for vote [{thread['vote_key']}] stopped at tweet {tweet['position']}", vote=thread['vote_key'], thread=threadID, position=tweet['position'])
+            return
+        except LeaseLostError:
+            log(f"Error - Lost the lease on outbox thread [{threadID}] for vote [{thread['vote_key']}], leaving it to the shard that took it", vote=thread['vote_key'], thread=threadID, position=tweet['position'])
+            return
+        now = str(CLOCK.now())
+        if tweetID == None:
+            #twitter will never take this tweet, and the rest of the thread has nothing to reply to
+            with db:
+                db.execute('UPDATE outbox_threads SET completed = ? WHERE id = ?', (now, threadID))
+                db.execute("UPDATE vote_ledger SET state = 'failed', updated = ? WHERE thread_id = ?", (now, threadID))
+                db.execute("UPDATE cspan_clips SET status = 'given_up' WHERE thread_id = ? AND status = 'pending'", (threadID,))
+            log(f"Error - Outbox thread [{threadID}] for vote [{thread['vote_key']}] failed at tweet {tweet['position']}, giving up on it", vote=thread['vote_key'], thread=threadID, position=tweet['position'])
+            return
+
+        with db:
+            db.execute('UPDATE outbox_tweets SET tweet_id = ?, posted = ? WHERE thread_id = ? AND position = ?', (str(tweetID), now, threadID, tweet['position']))
+            db.execute("UPDATE vote_ledger SET state = 'posting', tweets_posted = tweets_posted + 1, updated = ? WHERE thread_id = ?", (now, threadID))
+        countMetric('tweets_posted_total')
+        postedCount += 1
+        replyToID = str(tweetID)
+
+        #time from finding the vote to its first tweet going out is what we alert on
+        if tweet['position'] == 0 and thread['reply_to'] == None:
+            ledger = db.execute('SELECT detected, vote_time FROM vote_ledger WHERE thread_id = ?', (threadID,)).fetchone()
+            if ledger != None:
+                posted = datetime.fromisoformat(now)
+                lag = (posted - datetime.fromisoformat(ledger['detected'])).total_seconds()
+                observeMetric('detection_to_post_seconds', lag)
+                setMetric('last_detection_to_post_seconds', lag)
+                observeMetric('vote_to_post_seconds', (posted - datetime.strptime(ledger['vote_time'], "%Y-%m-%d %H:%M:%S")).total_seconds())
+
+    now = str(CLOCK.now())
+    with db:
+        db.execute('UPDATE outbox_threads SET completed = ? WHERE id = ?', (now, threadID))
+        db.execute("UPDATE vote_ledger SET state = 'complete', updated = ? WHERE thread_id = ?", (now, threadID))
+
+    elapsed = time.perf_counter() - start
+    observeMetric('publish_thread_seconds', elapsed)
+    log(f"Outbox thread [{threadID}] for vote [{thread['vote_key']}] complete, posted {postedCount} tweets in {elapsed:.1f} seconds", vote=thread['vote_key'], thread=threadID, tweets=postedCount, seconds=round(elapsed, 3))
+
+def runPublisher():
+    #publisher worker, drains the outbox whenever it's woken or every so often
+    log('Publisher starting up...')
+    loadTweepy()
+    while not SHUTDOWN.is_set():
+        PUBLISHER_WAKE.clear()
+        wait = PUBLISH_IDLE_WAIT
+        try:
+            publishOutbox()
+        except TwitterAccountError as e:
+            #retrying won't help until the keys or the account are sorted out, the outbox keeps everything until then
+            log(f"Error - Twitter refused our credentials, pausing the publisher for {PUBLISH_AUTH_ERROR_WAIT} seconds: {e}")
+            wait = PUBLISH_AUTH_ERROR_WAIT
+        except Exception as e:
+            log(f"Error - Publisher failed: {e}")
+        PUBLISHER_WAKE.wait(wait)
+
+def startPublisher():
+    #start the publisher worker in the background, any thread left part-way by a crash resumes first
+    global PUBLISHER_THREAD
+
+    if PUBLISHER_THREAD == None or not PUBLISHER_THREAD.is_alive():
+        PUBLISHER_THREAD = threading.Thread(target=runPublisher, name='Publisher', daemon=True)
+        PUBLISHER_THREAD.start()
+
+def resolveCSpanClip(voteKey, date):
+    #return a vote's c-span clip link, or '' if there isn't one yet
+    #a miss is remembered and the search isn't repeated until its next scheduled attempt
+    db = getDatabase()
+    row = db.execute('SELECT status, link, next_attempt FROM cspan_clips WHERE chamber = ? AND congress = ? AND session = ? AND roll_call = ?', voteKey).fetchone()
+    if row != None:
+        if row['status'] in ('found', 'posted'):
+            return row['link']
+        if row['status'] == 'given_up' or row['next_attempt'] > CLOCK.time():
+            countMetric('cspan_negative_cache_hits_total')
+            return ''
+
+    link = getCSpanClipLink(voteKey[0], voteKey[1], voteKey[3], date)
+    recordCSpanAttempt(voteKey, date, link)
+    return link
+
+def recordCSpanAttempt(voteKey, date, link):
+    #save the result of a clip search, scheduling the next search after a miss
+    db = getDatabase()
+    with db:
+        db.execute("INSERT OR IGNORE INTO cspan_clips (chamber, congress, session, roll_call, vote_date, status) VALUES (?, ?, ?, ?, ?, 'pending')", (*voteKey, date.strftime("%Y-%m-%d")))
+        if link != '':
+            db.execute("UPDATE cspan_clips SET status = 'found', link = ? WHERE chamber = ? AND congress = ? AND session = ? AND roll_call = ?", (link, *voteKey))
+            return
+
+        attempts = db.execute('SELECT attempts FROM cspan_clips WHERE chamber = ? AND congress = ? AND session = ? AND roll_call = ?', voteKey).fetchone()['attempts']
+        if attempts >= len(CSPAN_RETRY_DELAYS):
+            db.execute("UPDATE cspan_clips SET status = 'given_up', attempts = ? WHERE chamber = ? AND congress = ? AND session = ? AND roll_call = ?", (attempts + 1, *voteKey))
+        else:
+            db.execute('UPDATE cspan_clips SET attempts = ?, next_attempt = ? WHERE chamber = ? AND congress = ? AND session = ? AND roll_call = ?', (attempts + 1, CLOCK.time() + CSPAN_RETRY_DELAYS[attempts], *voteKey))
+
+def setCSpanClipThread(voteKey, threadID):
+    #remember which thread a pending clip belongs to so it can be replied to once found
+    db = getDatabase()
+    with db:
+        db.execute("UPDATE cspan_clips SET thread_id = ? WHERE chamber = ? AND congress = ? AND session = ? AND roll_call = ? AND status = 'pending'", (threadID, *voteKey))
+
+def resolvePendingCSpanClips():
+    #search again for clips that are due, and queue a reply to the vote's thread for any that turned up
+    db = getDatabase()
+    rows = db.execute("""
+        SELECT c.chamber, c.congress, c.session, c.roll_call, c.vote_date, c.thread_id, h.completed, l.state
+        FROM cspan_clips c JOIN outbox_threads h ON h.id = c.thread_id
+        LEFT JOIN vote_ledger l ON l.thread_id = c.thread_id
+        WHERE c.status = 'pending' AND c.next_attempt <= ? AND h.claimed_by = ?
+        ORDER BY c.next_attempt
+    """, (CLOCK.time(), SHARD_NAME)).fetchall()
+
+    for row in rows:
+        #wait for the thread to finish posting so the clip goes at the end of it
+        if row['completed'] == None:
+            continue
+
+        #a failed thread is completed too, but a clip replying to half a thread would only add to the mess
+        voteKey = (row['chamber'], row['congress'], row['session'], row['roll_call'])
+        lastTweet = db.execute('SELECT tweet_id FROM outbox_tweets WHERE thread_id = ? AND tweet_id IS NOT NULL ORDER BY position DESC LIMIT 1', (row['thread_id'],)).fetchone()
+        if row['state'] == 'failed' or lastTweet == None:
+            with db:
+                db.execute("UPDATE cspan_clips SET status = 'given_up' WHERE chamber = ? AND congress = ? AND session = ? AND roll_call = ?", voteKey)
+            continue
+
+        date = datetime.strptime(row['vote_date'], "%Y-%m-%d")
+        link = getCSpanClipLink(row['chamber'], row['congress'], row['roll_call'], date)
+        recordCSpanAttempt(voteKey, date, link)
+        if link != '':
+            log(f'Found late C-SPAN clip for vote [{voteKey}], replying to its thread...')
+            enqueueThread(voteKey, [(renderTweet('lateClip', {'cspanLink': link}), True)], lastTweet['tweet_id'], SHARD_NAME)
+            with db:
+                db.execute("UPDATE cspan_clips SET status = 'posted' WHERE chamber = ? AND congress = ? AND session = ? AND roll_call = ?", voteKey)
+            countMetric('cspan_late_clips_total')
+            PUBLISHER_WAKE.set()
+
+def runCSpanResolver():
+    log('C-SPAN clip resolver starting up...')
+    while not SHUTDOWN.is_set():
+        try:
+            resolvePendingCSpanClips()
+        except Exception as e:
+            log(f"Error - C-SPAN clip resolver failed: {e}")
+        CLOCK.wait(SHUTDOWN, CSPAN_RESOLVER_INTERVAL)
+
+def startCSpanResolver():
+    global CSPAN_RESOLVER_THREAD
+
+    if CSPAN_RESOLVER_THREAD == None or not CSPAN_RESOLVER_THREAD.is_alive():
+        CSPAN_RESOLVER_THREAD = threading.Thread(target=runCSpanResolver, name='CSpanResolver', daemon=True)
+        CSPAN_RESOLVER_THREAD.start()
+
+@timed('cspan_clip_search')
 def getCSpanClipLink(chamber, congress, voteNumber, date):
     log(f"Grabbing C Span clip link for {congress}-{chamber}-{voteNumber}")
 
@@ -400,16 +2153,26 @@ def getCSpanClipLink(chamber, congress, voteNumber, date):
     searchLink = f'https://www.c-span.org/congress/votes/?congress={congress}&chamber={chamber}&vote-status-sort=all&vote-number-search={voteNumber}&vote-start-date={date.month}%2F{date.day}%2F{date.year}&vote-end-date={date.month}%2F{date.day}%2F{date.year}'
 
     #run a get to retrieve the search page
-    with requests.get(searchLink) as searchData:
-        #parse the video result from the html
-        link = re.findall('''"\/\/www\.c-span\.org\/video\/\?.+"''', searchData.text)
+    searchData = httpGet(searchLink, stream=True)
+    if searchData == None:
+        return ''
+
+    with searchData:
+        #scan the page as it downloads and stop at the first video link, the rest of the page is never read
+        #the tail of each chunk is kept in case a link is split across two chunks
         finalLink = ''
-        if link != None and link != '' and len(link) > 0:
-            link = link[0]
-            link = link.replace('"', '')
-            link = link.replace('//', '')
-            link = link + "&vod"
-            finalLink = link
+        buffer = b''
+        for chunk in searchData.iter_content(chunk_size=CSPAN_CHUNK_SIZE):
+            buffer += chunk
+            match = CSPAN_CLIP_PATTERN.search(buffer)
+            if match != None:
+                link = match.group().decode('utf-8', 'replace')
+                link = link.replace('"', '')
+                link = link.replace('//', '')
+                link = link + "&vod"
+                finalLink = link
+                break
+            buffer = buffer[-1024:]
 
         return finalLink
 
@@ -441,7 +2204,7 @@ def getGovTrackVoteLink(congress, date, chamber, voteNumber):
 
 def getCongressNominationLink(congress, nomination):
     nomination = nomination.replace("PN", "")
-    congress = humanize.ordinal(congress)
+    congress = loadHumanize().ordinal(congress)
     link = f'https://www.congress.gov/nomination/{congress}-congress/{nomination}'
     return link
 
@@ -467,76 +2230,403 @@ def testPost():
     POST_TWEETS = False
     startBot()
 
-def log(message):
-    #log a message, add timestamp to it
-    message = f"{datetime.now()}: {message}"
-    message = message.replace('\n', '\t')
-    print(message)
-    message += '\n'
+def runReplay(votesPath, outputPath, online=False):
+    #run a recorded stream of votes through the whole pipeline on a virtual clock, writing every thread it would post to outputPath
+    #works on a copy of the database so the ledger and outbox start empty but the mirror, member index and c-span clips carry over
+    #offline unless asked, anything the mirror doesn't have is left out of the threads
+    #everything it points elsewhere is put back afterwards, so the process carries on as it was
+    global BASE_PATH
+    global DATABASE_LOCAL
+    global CACHE
+    global CLOCK
+    global POST_TWEETS
+    global HTTP_OFFLINE
+    global DRY_RUN_PUBLISHER
+    global ENRICHMENT_POOL
+    global MEMBER_INDEX
+
+    with open(votesPath, 'rb') as f:
+        votes = [Vote(v) for v in iterJsonArray(iter(lambda: f.read(HTTP_STREAM_CHUNK_SIZE), b''), 'votes')]
+    votes.sort(key=lambda v: (v.timestamp, v.key[3]))
+    log(f'Replaying {len(votes)} votes from [{votesPath}]...')
+    if len(votes) == 0:
+        return
+
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as replayPath:
+        os.makedirs(os.path.join(replayPath, "Data"))
+        source = os.path.join(BASE_PATH, "Data", "Bot.db")
+        if os.path.exists(source):
+            sourceDB = sqlite3.connect(source)
+            replayDB = sqlite3.connect(os.path.join(replayPath, "Data", "Bot.db"))
+            sourceDB.backup(replayDB)
+            sourceDB.close()
+            replayDB.close()
+        if os.path.exists(getCachePath()):
+            shutil.copy(getCachePath(), os.path.join(replayPath, "Data", "Cache.json"))
+
+        saved = (BASE_PATH, DATABASE_LOCAL, CACHE, CLOCK, POST_TWEETS, HTTP_OFFLINE, DRY_RUN_PUBLISHER, MEMBER_INDEX, dict(RATE_BUCKETS))
+        try:
+            BASE_PATH = replayPath
+            DATABASE_LOCAL = threading.local()
+            CACHE = None
+            CLOCK = VirtualClock(votes[0].when)
+            POST_TWEETS = False
+            HTTP_OFFLINE = not online
+            DRY_RUN_PUBLISHER = RecordingPublisher(record=True)
+            #the buckets are timed on the clock, so the replay's start fresh on the virtual one
+            RATE_BUCKETS.clear()
+
+            db = getDatabase()
+            with db:
+                db.execute('DELETE FROM outbox_tweets')
+                db.execute('DELETE FROM outbox_threads')
+                db.execute('DELETE FROM vote_ledger')
+                db.execute('UPDATE cspan_clips SET thread_id = NULL')
+                db.execute("INSERT OR REPLACE INTO bot_state (name, value) VALUES ('ledger_cutoff', '')")
+            loadMemberIndex()
+
+            #votes arrive the way polling would find them, everything with the same time together
+            start = time.perf_counter()
+            for timestamp, group in itertools.groupby(votes, key=lambda v: v.timestamp):
+                group = list(group)
+                CLOCK.advanceTo(group[0].when)
+                newVotes = getNewPostData(list(reversed(group)))
+                postNewVotes(newVotes)
+                publishOutbox()
+
+            with open(outputPath, 'w', encoding='utf-8') as f:
+                f.write(formatRecordedThreads(DRY_RUN_PUBLISHER.tweets))
+            log(f'Replayed {len(votes)} votes into {len(DRY_RUN_PUBLISHER.tweets)} tweets in {time.perf_counter() - start:.1f} seconds, threads written to [{outputPath}]')
+        finally:
+            if ENRICHMENT_POOL != None:
+                ENRICHMENT_POOL.shutdown()
+                ENRICHMENT_POOL = None
+            if getattr(DATABASE_LOCAL, 'connection', None) != None:
+                DATABASE_LOCAL.connection.close()
+            flushLog()
+            BASE_PATH, DATABASE_LOCAL, CACHE, CLOCK, POST_TWEETS, HTTP_OFFLINE, DRY_RUN_PUBLISHER, MEMBER_INDEX, rateBuckets = saved
+            RATE_BUCKETS.clear()
+            RATE_BUCKETS.update(rateBuckets)
+
+def formatRecordedThreads(tweets):
+    #lay recorded tweets out thread by thread, each under its vote, so two runs can be diffed
+    db = getDatabase()
+    threads = []
+    threadOf = {}
+    for tweet in tweets:
+        if tweet['replyTo'] in threadOf:
+            thread = threadOf[tweet['replyTo']]
+        else:
+            row = db.execute('SELECT h.vote_key FROM outbox_tweets t JOIN outbox_threads h ON h.id = t.thread_id WHERE t.tweet_id = ?', (tweet['id'],)).fetchone()
+            thread = [f"[{row['vote_key'] if row != None else 'unknown vote'}]"]
+            threads.append(thread)
+        threadOf[tweet['id']] = thread
+
+        flags = ' (no embeds)' if tweet['stopEmbeds'] else ''
+        text = tweet['text'].replace('\n', '\n    ')
+        thread.append(f"  {len(thread)}.{flags} {text}")
+    return '\n\n'.join('\n'.join(thread) for thread in threads) + '\n'
 
-    #save the last post timestamp so we know which records (should) have already been posted
-    path = os.path.join(BASE_PATH, "Data", "Logs")
+def log(message, **fields):
+    #log a message, add timestamp to it
+    #extra fields only show up in json logs
+    now = datetime.now()
+    message = str(message)
+    print(f"{now}: {message}".replace('\n', '\t'))
+
+    if LOG_THREAD == None:
+        startLogWriter()
+    LOG_QUEUE.put((now, message, fields, getLogPath()))
+
+def getLogPath():
+    #worked out as each message is logged, so a message goes where the bot was pointed when it was logged
+    #LOG_PATH pins it, so a replay working in a temporary folder still logs to the real one
+    if LOG_PATH != None:
+        return LOG_PATH
+    return os.path.join(BASE_PATH, "Data", "Logs")
+
+def startLogWriter():
+    global LOG_THREAD
+
+    with LOG_LOCK:
+        if LOG_THREAD == None:
+            LOG_THREAD = threading.Thread(target=runLogWriter, name='LogWriter', daemon=True)
+            LOG_THREAD.start()
+            atexit.register(flushLog)
+
+def flushLog():
+    #block until everything logged so far is on disk
+    if LOG_THREAD == None:
+        return
+    flushed = threading.Event()
+    LOG_QUEUE.put(flushed)
+    flushed.wait(10)
+
+def formatLogRecord(now, message, fields):
+    if LOG_JSON:
+        return json.dumps({'time': now.isoformat(), 'message': message, **fields}, default=str) + '\n'
+    return f"{now}: {message}".replace('\n', '\t') + '\n'
+
+def openLogFile(path, day):
+    #open the next log file for a day, numbering the ones after the first when a day's log gets too big
     if not os.path.isdir(path):
         os.makedirs(path)
-    
-    #write a new log each day
-    fileName = f'Log_{datetime.strftime(datetime.today(), "%Y-%m-%d")}.txt'
-    path = os.path.join(path, fileName)
-    with open(path, 'a+') as f:
-        f.write(message)
-        
+
+    extension = 'jsonl' if LOG_JSON else 'txt'
+    shard = f'_{SHARD_NAME}' if SHARD_NAME != 'main' else ''
+    part = 0
+    while True:
+        suffix = f'_{part}' if part > 0 else ''
+        fileName = os.path.join(path, f'Log{shard}_{day}{suffix}.{extension}')
+        if not os.path.exists(fileName) or os.path.getsize(fileName) < LOG_MAX_BYTES:
+            return open(fileName, 'a', encoding='utf-8')
+        part += 1
+
+def runLogWriter():
+    #collect messages for up to LOG_FLUSH_INTERVAL and write each batch with a single write and flush
+    logFile = None
+    logDay = None
+    logPath = None
+    while True:
+        records = [LOG_QUEUE.get()]
+        deadline = time.monotonic() + LOG_FLUSH_INTERVAL
+        while len(records) < LOG_BATCH_SIZE and not isinstance(records[-1], threading.Event):
+            try:
+                records.append(LOG_QUEUE.get(timeout=max(0, deadline - time.monotonic())))
+            except queue.Empty:
+                break
+
+        #every message is already on stdout, so if the file can't be opened or written the batch is only dropped from the file
+        #the next batch tries opening it again
+        try:
+            lines = []
+            pendingBytes = 0
+            for record in records:
+                if isinstance(record, threading.Event):
+                    continue
+
+                #rotate on a new day, a new log folder or once the file is full, whatever is buffered goes in the old file first
+                now, message, fields, path = record
+                day = now.strftime("%Y-%m-%d")
+                if logFile == None or day != logDay or path != logPath or logFile.tell() + pendingBytes >= LOG_MAX_BYTES:
+                    if logFile != None:
+                        oldFile = logFile
+                        logFile = None
+                        oldFile.write(''.join(lines))
+                        oldFile.close()
+                        lines = []
+                        pendingBytes = 0
+                    logFile = openLogFile(path, day)
+                    logDay = day
+                    logPath = path
+
+                line = formatLogRecord(now, message, fields)
+                lines.append(line)
+                pendingBytes += len(line.encode('utf-8'))
+
+            if logFile != None and len(lines) > 0:
+                logFile.write(''.join(lines))
+                logFile.flush()
+        except OSError as e:
+            print(f"{datetime.now()}: Error - Could not write log file: {e}")
+            if logFile != None:
+                try:
+                    logFile.close()
+                except OSError:
+                    pass
+                logFile = None
+
+        for record in records:
+            if isinstance(record, threading.Event):
+                record.set()
+
 def startBot():
-    #full process, run in a loop. Later will remove the loop and just schedule the program instead
-    log(f"Bot starting up...")
-    while 1 != 0:
-        log(f"Starting update process...")
-        lastDate = getLastPostTimestamp()
-        voteData = getVotesInDateRange(lastDate, datetime.today())
-        #voteData = getRecentVotes()
-        if voteData != None:
-            length = len(voteData)
-            if (length > 0):
-                log(f'{length} votes found since last post date...')
-                newVoteData = getNewPostData(lastDate, voteData)
-                log(f'{len(newVoteData)} new votes found since last post...')
-                if(len(newVoteData) > 0):
-                    postNewVotes(newVoteData)
-        else:
-            log(f"Error - No data returned from votes date range API request...")
-        if UPDATE_BIO:
-            updateLastUpdate()
-        log(f"Update process complete")
+    #full process, polling each chamber on its own schedule until the process is stopped
+    log(f"Bot starting up as shard [{SHARD_NAME}] for {', '.join(getShardChamberNames())}...")
+    if METRICS_PORT != None:
+        startMetricsServer(METRICS_PORT)
+    loadMemberIndex()
+    startPublisher()
+    startCSpanResolver()
+
+    #the rosters are in place before the first vote is rendered, maintenance keeps them fresh after that
+    refreshMemberIndex()
+
+    #votes seen before a crash but never queued get rendered first, queued ones resume in the publisher
+    resumeUnqueuedVotes()
+
+    lastMaintenance = 0
+    while not SHUTDOWN.is_set():
+        writeHealth('running')
+        newVoteData = []
+        for chamber in SHARD_CHAMBERS:
+            if SHUTDOWN.is_set():
+                break
+            if chamber in POLL_SCHEDULE and POLL_SCHEDULE[chamber]['next'] > CLOCK.time():
+                continue
+
+            log(f"Polling {chamber.value} votes...")
+            newChamberVotes = []
+            with timed('poll_chamber'):
+                voteData = pollChamber(chamber)
+            if voteData != None:
+                if len(voteData) > 0:
+                    log(f'{len(voteData)} {chamber.value} votes found since last vote date...')
+                    with timed('filter_new_votes'):
+                        newChamberVotes = getNewPostData(voteData)
+            elif not SHUTDOWN.is_set():
+                log(f"Error - No data returned from {chamber.value} votes API request...")
+            newVoteData.extend(newChamberVotes)
+            schedulePoll(chamber, len(newChamberVotes))
+
+        if(len(newVoteData) > 0):
+            log(f'{len(newVoteData)} new votes found since last post...')
+            newVoteData.sort(key=lambda v: v.timestamp)
+            with timed('queue_new_votes'):
+                postNewVotes(newVoteData)
+
+        #housekeeping runs on its own timer rather than after every poll
+        if CLOCK.time() - lastMaintenance >= MAINTENANCE_INTERVAL and not SHUTDOWN.is_set():
+            refreshMemberIndex()
+            resumeUnqueuedVotes()
+            if UPDATE_BIO:
+                updateLastUpdate()
+            saveCache()
+            logHTTPStats()
+            logCacheStats()
+            logRateBudget()
+            updateStatusMetrics()
+            logMetricsSummary()
+            lastMaintenance = CLOCK.time()
+
+        wait = min(getNextPollTime(), lastMaintenance + MAINTENANCE_INTERVAL) - CLOCK.time()
+        if wait > 0:
+            CLOCK.wait(SHUTDOWN, min(wait, HEALTH_INTERVAL))
+
+def requestShutdown(signalNumber=None, frame=None):
+    #signal handler, only sets events since it can interrupt the main thread anywhere
+    SHUTDOWN.set()
+    PUBLISHER_WAKE.set()
+
+def stopBot():
+    #wait for the workers to reach a checkpoint, then write out everything held in memory
+    log('Shutting down...')
+    SHUTDOWN.set()
+    PUBLISHER_WAKE.set()
+    for thread in (PUBLISHER_THREAD, CSPAN_RESOLVER_THREAD):
+        if thread != None:
+            thread.join(SHUTDOWN_TIMEOUT)
+            if thread.is_alive():
+                log(f'Warning: {thread.name} didn\'t stop within {SHUTDOWN_TIMEOUT} seconds, its work resumes on the next start')
+    if ENRICHMENT_POOL != None:
+        ENRICHMENT_POOL.shutdown(wait=False, cancel_futures=True)
+    saveCache()
+    logMetricsSummary(force=True)
+    writeHealth('stopped')
+    log('Shutdown complete')
+    flushLog()
+
+def writeHealth(status):
+    #health check file for whatever supervises the bot, a stale updated time means it's hung
+    path = os.path.join(BASE_PATH, "Data")
+    if not os.path.isdir(path):
+        os.makedirs(path)
 
-        log(f"Waiting for 300 seconds...")
-        time.sleep(300)
+    shard = f'_{SHARD_NAME}' if SHARD_NAME != 'main' else ''
+    path = os.path.join(path, f'Health{shard}.json')
+    nextPoll = getNextPollTime()
+    health = {
+        'status': status,
+        'pid': os.getpid(),
+        'shard': SHARD_NAME,
+        'updated': datetime.fromtimestamp(CLOCK.time()).isoformat(timespec='seconds'),
+        'nextPoll': datetime.fromtimestamp(nextPoll).isoformat(timespec='seconds') if nextPoll > 0 else None,
+        'publisherAlive': PUBLISHER_THREAD != None and PUBLISHER_THREAD.is_alive(),
+        'outboxPendingTweets': getDatabase().execute('SELECT COUNT(*) FROM outbox_tweets WHERE tweet_id IS NULL').fetchone()[0],
+    }
+    with open(path + '.tmp', 'w') as f:
+        json.dump(health, f, indent=4)
+    os.replace(path + '.tmp', path)
 
 def main():
     global BASE_PATH 
+    global BOT_SCREEN_NAME
+    global SHARD_NAME
+    global SHARD_CHAMBERS
+    global SHARD_ACCOUNT
     global TWITTER_CONSUMER_KEY 
     global TWITTER_CONSUMER_SECRET 
     global TWITTER_TOKEN 
     global TWITTER_TOKEN_SECRET 
     global PROPUBLICA_API_KEY 
+    global LOG_JSON
+    global LOG_PATH
+    global METRICS_PORT
+
+    parseDate = lambda value: datetime.strptime(value, "%Y-%m-%d")
+    parser = argparse.ArgumentParser(description='Posts congressional votes to twitter')
+    parser.add_argument('mode', nargs='?', choices=['run', 'backfill', 'replay'], default='run', help='run the bot, backfill the vote ledger for a date range, or dry run a recorded vote stream')
+    parser.add_argument('--start', type=parseDate, help='backfill start date, YYYY-MM-DD')
+    parser.add_argument('--end', type=parseDate, default=datetime.today(), help='backfill end date, YYYY-MM-DD, defaults to today')
+    parser.add_argument('--chamber', choices=[c.value for c in Chamber], default=Chamber.BOTH.value, help='chamber to poll and post for, or to backfill')
+    parser.add_argument('--account', help='post as this account, reading its keys from the env file with the name as a prefix, like SENATE_TWITTER_TOKEN')
+    parser.add_argument('--shard', help='name of this worker when running more than one, defaults to the account name')
+    parser.add_argument('--workers', type=int, default=BACKFILL_WORKERS, help='date range chunks to fetch at once')
+    parser.add_argument('--post', action='store_true', help='post backfilled votes the next time the bot runs instead of only recording them')
+    parser.add_argument('--votes', help='votes to replay, saved from a propublica votes response')
+    parser.add_argument('--output', help='file to write the replayed threads to')
+    parser.add_argument('--online', action='store_true', help='let the replay look up what the mirror doesn\'t have')
+    parser.add_argument('--log-json', action='store_true', help='write the log file as json lines')
+    parser.add_argument('--metrics-port', type=int, help='serve prometheus metrics on this local port')
+    args = parser.parse_args()
+    LOG_JSON = args.log_json
+    METRICS_PORT = args.metrics_port
+    SHARD_NAME = args.shard or (args.account.lower() if args.account != None else SHARD_NAME)
+    if args.account != None:
+        SHARD_ACCOUNT = args.account.lower()
+    if args.chamber != Chamber.BOTH.value:
+        SHARD_CHAMBERS = (Chamber(args.chamber),)
+
+    #load constants, before anything is logged since the log lives under it
+    BASE_PATH = Path(os.path.realpath(__file__)).parent
+    LOG_PATH = os.path.join(BASE_PATH, "Data", "Logs")
 
     log('Initializing program...')
 
-    #load constants
-    BASE_PATH = Path(os.path.realpath(__file__)).parent
-
     #now load sensitive data, api keys from env file
     env_path = os.path.join(Path(os.path.dirname(os.path.realpath(__file__))).parent, "Keys", "CongressionalVotesTwitterBot.env")
     dotenv.load_dotenv(env_path)
-    TWITTER_CONSUMER_KEY = os.getenv('TWITTER_CONSUMER_KEY')
-    TWITTER_CONSUMER_SECRET = os.getenv('TWITTER_CONSUMER_SECRET')
-    TWITTER_TOKEN = os.getenv('TWITTER_TOKEN')
-    TWITTER_TOKEN_SECRET = os.getenv('TWITTER_TOKEN_SECRET')
+    prefix = args.account.upper() + '_' if args.account != None else ''
+    TWITTER_CONSUMER_KEY = os.getenv(prefix + 'TWITTER_CONSUMER_KEY')
+    TWITTER_CONSUMER_SECRET = os.getenv(prefix + 'TWITTER_CONSUMER_SECRET')
+    TWITTER_TOKEN = os.getenv(prefix + 'TWITTER_TOKEN')
+    TWITTER_TOKEN_SECRET = os.getenv(prefix + 'TWITTER_TOKEN_SECRET')
+    BOT_SCREEN_NAME = os.getenv(prefix + 'TWITTER_SCREEN_NAME', BOT_SCREEN_NAME)
     PROPUBLICA_API_KEY = os.getenv('PROPUBLICA_API_KEY')
 
     #run bot in test mode
     #testPost()
 
-    #run the bot
-    startBot()
+    if args.mode == 'backfill':
+        if args.start == None:
+            parser.error('backfill needs a --start date')
+        runBackfill(args.start, args.end, Chamber(args.chamber), args.workers, args.post)
+        return
+
+    if args.mode == 'replay':
+        if args.votes == None or args.output == None:
+            parser.error('replay needs --votes and --output')
+        runReplay(args.votes, args.output, args.online)
+        flushLog()
+        return
+
+    #run the bot until it's told to stop, then shut down cleanly
+    signal.signal(signal.SIGTERM, requestShutdown)
+    signal.signal(signal.SIGINT, requestShutdown)
+    try:
+        startBot()
+    finally:
+        stopBot()
 
 if __name__ == '__main__':
     main()